@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# Render benchmark of the TUI widgets, drawn on a virtual screen so that it
+# runs anywhere without a terminal. Each widget (and a whole frame) is drawn
+# against a few game states; reports time per frame and the memory allocated
+# while drawing one.
+#
+#   ./bench.py [--frames=300] [--state=data/state.bin] [--json=out.json]
+#   ./bench.py --compare=before.json
+
+import argparse
+import json
+import pickle
+import random
+import statistics
+import time
+import tracemalloc
+import chess
+import chess.engine
+from wccc import progressbar
+from wccc import tui
+from wccc import virtualscreen
+from main import NewState, PrepareState
+
+WIDGETS = [
+    tui.ChessBoard,
+    tui.Thinking,
+    tui.MoveList,
+    tui.EvalGraph,
+    tui.StatusBar,
+    tui.Status,
+    tui.Engine,
+    tui.Timer,
+    tui.HelpPane,
+    tui.MoveInput,
+]
+
+
+def RandomGame(plies, seed):
+    rnd = random.Random(seed)
+    while True:
+        board = chess.Board()
+        while len(board.move_stack) < plies and not board.is_game_over():
+            board.push(rnd.choice(list(board.legal_moves)))
+        if len(board.move_stack) == plies and not board.is_game_over():
+            return board
+
+
+def Wdl(rnd):
+    w = rnd.randint(0, 600)
+    d = rnd.randint(0, 1000 - w)
+    return chess.engine.Wdl(w, d, 1000 - w - d)
+
+
+def Thinking(board, num_moves, rnd):
+    moves = {}
+    for move in list(board.legal_moves)[:num_moves]:
+        moves[move.uci()] = {
+            'score': chess.engine.Cp(rnd.randint(-300, 300)),
+            'wdl': Wdl(rnd),
+            'nodes': rnd.randint(1000, 5000000),
+        }
+    pv = []
+    if moves:
+        best = chess.Move.from_uci(max(moves, key=lambda x: moves[x]['nodes']))
+        board.push(best)
+        pv = [best] + list(board.legal_moves)[:1]
+        board.pop()
+    prev = {
+        'time': 10,
+        'moves': {k: dict(v, nodes=v['nodes'] // 2)
+                  for k, v in moves.items()},
+    }
+    return {'prev': prev, 'curr': {'time': 11, 'moves': moves, 'pv': pv}}
+
+
+def MakeState(plies, num_moves):
+    rnd = random.Random(plies)
+    state = PrepareState(NewState(), 0)
+    state['board'] = RandomGame(plies, plies)
+    state['move_info'] = [Wdl(rnd) for _ in range(plies)]
+    state['thinking'] = Thinking(state['board'], num_moves, rnd)
+    state['engine'] = True
+    state['timerenabled'] = True
+    state['profilenames'] = ['default']
+    state['nps'] = 45000
+    state['depth'] = 17
+    state['seldepth'] = 40
+    return state
+
+
+def States(args):
+    res = {
+        'opening': MakeState(4, 3),
+        'middlegame': MakeState(40, 12),
+        'endgame': MakeState(150, 12),
+    }
+    if args.state:
+        with open(args.state, 'rb') as f:
+            state = PrepareState(pickle.load(f), 0)
+        state.setdefault('profilenames', ['default'])
+        res['recorded'] = state
+    return res
+
+
+def Measure(draw, frames):
+    for _ in range(min(10, frames)):
+        draw()
+    times = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        draw()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    peaks = []
+    for _ in range(min(20, frames)):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        draw()
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return {
+        'median_us': statistics.median(times) * 1e6,
+        'p95_us': sorted(times)[int(len(times) * 0.95)] * 1e6,
+        'alloc_kb': statistics.median(peaks) / 1024,
+    }
+
+
+def Benchmarks(states):
+    res = {}
+    for name, state in states.items():
+        screen = virtualscreen.VirtualWindow(tui.SCREEN_HEIGHT + 3,
+                                             tui.SCREEN_WIDTH + 6)
+        widgets = tui.CreateWidgets(screen, state)
+
+        # Bound now, each state's frame draws its own widgets.
+        def Frame(widgets=widgets):
+            for widget in widgets:
+                widget.Draw()
+
+        res[f'frame/{name}'] = Frame
+        for widget_class in WIDGETS:
+            widget = widget_class(screen, state)
+            res[f'{widget_class.__name__}/{name}'] = widget.Draw
+
+    win = virtualscreen.VirtualWindow(2, 60)
+
+    def Bar(draw):
+
+        def Run():
+            win.move(0, 0)
+            draw()
+
+        return Run
+
+    res['progressbar.ProgressBar'] = Bar(lambda: progressbar.ProgressBar(
+        win, 32, 1234567, 2000000, 'N=1234567 P=12.3%', 19, 20, 21))
+    res['progressbar.WdlBar'] = Bar(lambda: progressbar.WdlBar(
+        win, 46, 312, 455, 233, 12, 13, 14, 15, 16, 17))
+    res['progressbar.TickBar'] = Bar(
+        lambda: progressbar.TickBar(win, 46, 0.56, 24, 23))
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Widget render benchmark.')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--state', help='Also bench a saved state.bin')
+    parser.add_argument('--filter', default='', help='Only names with this')
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--compare', help='Results to compare with')
+    args = parser.parse_args()
+
+    virtualscreen.Install()
+    before = {}
+    if args.compare:
+        with open(args.compare) as f:
+            before = json.load(f)
+    results = {}
+    print(f"{'benchmark':32} {'median':>10} {'p95':>10} {'alloc':>9}")
+    for name, draw in Benchmarks(States(args)).items():
+        if args.filter not in name:
+            continue
+        res = results[name] = Measure(draw, args.frames)
+        line = (f"{name:32} {res['median_us']:8.1f}us {res['p95_us']:8.1f}us "
+                f"{res['alloc_kb']:7.1f}KB")
+        if name in before:
+            line += " %+6.1f%%" % (
+                100 * (res['median_us'] / before[name]['median_us'] - 1))
+        print(line)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
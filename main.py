@@ -5,11 +5,34 @@ import logging
 import chess
 import chess.engine
 import chess.polyglot
+import concurrent.futures
 import curses
 import datetime
 import pickle
+import signal
+import sys
+import statistics
 import threading
+import time
+from wccc import profiles
+from wccc.broadcast import BroadcastServer
+from wccc.clock import SystemClock
+from wccc.livepgn import LivePgn
+from wccc.movecodec import EncodeMove
+from wccc.moveindex import MoveIndex
+from wccc.movestats import MoveStatsCollector
+from wccc.pgnindex import PgnIndex, GameLine
+from wccc.prepdb import PrepDb
+from wccc.sampler import Sampler
+from wccc.searchlog import SearchLogWriter
+from wccc.stability import StabilityDetector
+from wccc.telemetry import Telemetry
+from wccc.timeline import Timeline
+from wccc.whatif import WhatIfEngine, NewLine
+from wccc.wiretrace import WireTrace
 from wccc.tui import Tui
+from wccc.remote import TerminalRelay
+from wccc.uilink import UiServer, RunUiClient
 from wccc.config import *
 
 MULTIPV = 12
@@ -23,145 +46,578 @@ LOG_DATE_FORMAT = '%m%d %H:%M:%S'
 
 LOCK = threading.Lock()
 
+# Settings that belong to the engine rather than to a game, carried over when
+# switching boards.
+ENGINE_KEYS = ['profile', 'selectedprofile', 'profilestatus', 'movestats']
+
+
+def StatePath(game):
+    name = 'state.bin' if game == 0 else f'state-{game}.bin'
+    return os.path.join(DATA_DIR, name)
+
+
+def NewState():
+    return {
+        'board': chess.Board(),
+        'move_info': [],
+        'flipped': False,
+        'statusbar': "",
+        'engine': False,
+        'enginestatus': "Not doing anything",
+        'timedsearch': [True, False],
+        'timer': [START_TIME, START_TIME],
+        'movetimer': [0, 0],
+        'timerenabled': False,
+        'lasttimestamp': None,
+        'info': [],
+        'forcemove': False,
+        'moveready': False,
+        'nextmove': '',
+        'promotion': 'Q',
+        'commitmove': False,
+        'undo': False,
+        'nps': 0,
+        'depth': 0,
+        'seldepth': 0,
+        'autocommitenabled': True,
+        'movenotify': False,
+        'piecedisplay': 0,
+        'drift_compensation': round(INCREMENT) / 2,
+    }
+
+
+def LivePgnPath(game):
+    (name, ext) = os.path.splitext(LIVE_PGN)
+    if game != 0:
+        name += f'-{game}'
+    return os.path.join(DATA_DIR, name + ext)
+
+
+def LoadState(game):
+    try:
+        state = {}
+        with open(StatePath(game), 'rb') as f:
+            state = pickle.load(f)
+    except:
+        state = NewState()
+    return PrepareState(state, game)
+
+
+def PrepareState(state, game):
+    # Keys added after existing state.bin files were written.
+    for key, value in {
+            'profile': ENGINE_PROFILE,
+            'selectedprofile': ENGINE_PROFILE,
+            'switchprofile': None,
+            'profilestatus': '',
+            'movestats': MOVE_STATS,
+            'alert': '',
+            'boards': '',
+            'switchboard': False,
+            'prepared': None,
+            'premove': '',
+            'predicted': '',
+            'playpremove': False,
+            'startprofile': False,
+            'whatifadd': '',
+            'explorer': False,
+            'explorerinfo': None,
+            'stablesaved': 0.0,
+    }.items():
+        state.setdefault(key, value)
+    state['game'] = game
+    state['lasttimestamp'] = datetime.datetime.now()
+    state['thinking'] = {}
+    state['moveindex'] = None
+    # What-if lines aren't resumed after a restart.
+    state['whatif'] = []
+    state['whatifview'] = 0
+    state['pvexpand'] = 0
+    state['stable'] = None
+    # Notices aren't resumed after a restart either.
+    state['statusbar'] = ''
+    return state
+
+
+def SideToMove(state):
+    return 0 if state['board'].turn else 1
+
+
+# When only one side is played by the engine, the increments are skewed to
+# make up for the time lost entering its moves on the real board.
+def GetIncrement(state, white_color, increment=INCREMENT):
+    if state['timedsearch'][0] == state['timedsearch'][1]:
+        return increment
+    if (white_color == chess.WHITE) == state['timedsearch'][0]:
+        return max(0, increment - state['drift_compensation'])
+    else:
+        return min(2 * increment, increment + state['drift_compensation'])
+
 
 class Controller:
 
-    def __init__(self):
-        os.chdir(LC0_DIRECTORY)
-        logging.info("Starting engine %s" % repr(COMMAND_LINE))
-        self.engine = chess.engine.SimpleEngine.popen_uci(
-            COMMAND_LINE, timeout=20)  # , stderr=subprocess.DEVNULL)
-        logging.info(f"Engine name: {self.engine.id['name']}")
-        print("Initializing engine...")
+    # clock and command_line are for simulations, see wccc/simulate.py.
+    def __init__(self, clock=None, command_line=None):
+        self.clock = clock or SystemClock()
+        self.timeline = Timeline()
         self.search = None
+        self.search_state = None
+        self.search_limit = None
+        self.search_multipv = MULTIPV
+        self.search_infos = 0
+        self.search_cost = 0
+        self.search_started = self.clock.Monotonic()
+        self.search_nodes = 0
+        self.telemetry = Telemetry(TELEMETRY_SLOWDOWN_RATIO)
+        self.move_stats = MoveStatsCollector(MOVE_STATS_INTERVAL)
+        self.stability = StabilityDetector(STABLE_WINDOW, STABLE_SWING,
+                                           STABLE_WDL_MARGIN)
+        # Seconds the engine is expected to use on the timed search.
+        self.search_budget = None
+        # Position and kind of search the running one is for.
+        self.search_key = None
+        # While changes to the analysed game are coalesced: when the search
+        # is restarted if nothing else changes, and how many changes so far.
+        self.restart_at = None
+        self.restart_changes = 0
+        # Games whose state file is written once the changes settle.
+        self.unsaved = set()
+        # Simulated games aren't saved.
+        self.save_states = True
+        self.stable_infos = 0
+        self.stable_stopped = False
+        self.search_log = None
+        if SEARCH_LOG:
+            self.search_log = SearchLogWriter(
+                os.path.join(DATA_DIR, SEARCH_LOG))
+        self.sampler = Sampler(LOGS_DIR, PROFILE_INTERVAL)
+        # Set by the sampling thread, shown from the main loop.
+        self.profile_done = None
+        # (state, expiry, plies) of the status bar notice shown.
+        self.notice = None
+        self.wire_trace = None
+        # Set when a bestmove was picked up, until the frame showing it.
+        self.move_shown_pending = False
+        if WIRE_TRACE:
+            self.wire_trace = WireTrace(
+                os.path.join(
+                    LOGS_DIR,
+                    f'wire-{datetime.datetime.now().strftime("%Y%m%d-%H%M%S")}.bin'
+                ))
+        self.broadcast = None
+        if BROADCAST_SOCKET:
+            self.broadcast = BroadcastServer(
+                os.path.join(DATA_DIR, BROADCAST_SOCKET), BROADCAST_INTERVAL)
+        self.relay = None
+        # When the operator started entering the current move, and how long
+        # recent manual entries took, to estimate what premoves save.
+        self.entry_started = None
+        self.entry_times = []
+        self.prep_db = None
+        self.prep_keys = {}
+        self.move_index_keys = {}
         self.opening_book = None
+        self.engine = None
+        self.move_stats_configured = False
+        # The engine and the book are loaded in the background while the UI
+        # shows the restored games. Nothing is searched until both are done.
+        self.ready = False
+        # (profile, start time, how) while the engine restarts for a switch.
+        self.switching = None
+        self.startup = concurrent.futures.ThreadPoolExecutor(
+            thread_name_prefix='startup')
+        self.startup_tasks = [self.startup.submit(self.LoadBook)]
+
+        # All games share one engine; self.state is the one on screen.
+        with self.timeline.Phase('state'):
+            self.games = [LoadState(game) for game in range(BOARDS)]
+        self.state = self.games[0]
+        for state in self.games:
+            state['enginestatus'] = "Engine warming up..."
+            state['lasttimestamp'] = self.clock.Now()
+        with self.timeline.Phase('prepdb'):
+            if PREP_DB and os.path.exists(os.path.join(DATA_DIR, PREP_DB)):
+                self.prep_db = PrepDb(os.path.join(DATA_DIR, PREP_DB))
+        self.live_pgn = []
+        if LIVE_PGN:
+            self.live_pgn = [LivePgn(LivePgnPath(x)) for x in range(BOARDS)]
+        self.pgn_index = None
+        self.explorer_keys = {}
+        with self.timeline.Phase('pgnindex'):
+            if PGN_INDEX and os.path.exists(os.path.join(DATA_DIR, PGN_INDEX)):
+                self.pgn_index = PgnIndex(os.path.join(DATA_DIR, PGN_INDEX))
+
+        self.profiles = profiles.LoadProfiles(
+            os.path.join(BASE_DIR, PROFILES_FILE))
+        if self.state['profile'] not in self.profiles:
+            logging.info("Unknown profile %s" % self.state['profile'])
+            self.state['profile'] = profiles.DEFAULT_PROFILE
+        for state in self.games:
+            state['profilenames'] = list(self.profiles)
+        self.base_command_line = COMMAND_LINE
+        whatif_command_line = WHATIF_COMMAND_LINE
+        if command_line:
+            self.base_command_line = command_line
+        elif USE_STUB_ENGINE:
+            self.base_command_line = STUB_COMMAND_LINE
+            whatif_command_line = STUB_COMMAND_LINE
+        else:
+            os.chdir(LC0_DIRECTORY)
+        self.whatif = None
+        self.whatif_shown = None
+        if whatif_command_line:
+            self.whatif = WhatIfEngine(whatif_command_line, WHATIF_NODES,
+                                       WHATIF_MULTIPV)
+        self.startup_tasks.append(
+            self.startup.submit(
+                self.StartEngine,
+                profiles.ApplyProfile(self.base_command_line,
+                                      self.profiles[self.state['profile']])))
+        # self.engine.info_handlers.append(InfoAppender(self.state))
+
+    def LoadBook(self):
         if OPENING_BOOK:
-            self.opening_book = chess.polyglot.open_reader(
-                os.path.join(BASE_DIR, OPENING_BOOK))
+            with self.timeline.Phase('book'):
+                self.opening_book = chess.polyglot.open_reader(
+                    os.path.join(BASE_DIR, OPENING_BOOK))
+
+    # Checked every loop until the background startup, or an engine restart
+    # for a profile switch, is done; re-raises if the engine failed to start.
+    def CheckStartup(self):
+        if self.ready or not all(x.done() for x in self.startup_tasks):
+            return
+        self.startup.shutdown()
+        if self.switching:
+            self.FinishSwitch()
+        else:
+            for task in self.startup_tasks:
+                task.result()
+            self.timeline.Mark('ready')
+            self.timeline.Log()
+        self.ready = True
+        for state in self.games:
+            state['enginestatus'] = "Engine ready."
+        self.tui.scheduler.Urgent()
+
+    def StartEngine(self, command_line):
+        logging.info("Starting engine %s" % repr(command_line))
+        self.command_line = command_line
+        self.move_stats_configured = False
+        protocol = chess.engine.UciProtocol
+        if self.wire_trace:
+            protocol = self.wire_trace.Protocol()
+        with self.timeline.Phase('engine'):
+            self.engine = chess.engine.SimpleEngine.popen(
+                protocol, command_line,
+                timeout=20)  # , stderr=subprocess.DEVNULL)
+        logging.info(f"Engine name: {self.engine.id['name']}")
 
+    def SwitchProfile(self, name):
+        start = time.monotonic()
+        command_line = profiles.ApplyProfile(self.base_command_line,
+                                             self.profiles[name])
+        changed = profiles.ChangedFlags(self.command_line, command_line)
+        (uci, restart) = profiles.PlanSwitch(self.engine.options, changed)
+        logging.info(f"Switching to profile {name}: setoption={uci} "
+                     f"restart={restart}")
+
+        # Discard the running search, its bestmove must not be played.
+        self.DiscardSearch()
+        if restart:
+            # Restarted in the background like at startup, nothing is
+            # searched until CheckStartup sees it done.
+            self.ready = False
+            for state in self.games:
+                state['enginestatus'] = "Restarting engine..."
+            self.switching = (name, start,
+                              "restart (%s)" % ', '.join(restart))
+            self.startup = concurrent.futures.ThreadPoolExecutor(
+                thread_name_prefix='startup')
+            self.startup_tasks = [
+                self.startup.submit(self.RestartEngine, command_line)
+            ]
+            return
         try:
-            self.state = {}
-            with open(os.path.join(DATA_DIR, 'state.bin'), 'rb') as f:
-                self.state = pickle.load(f)
-        except:
-            self.state = {
-                'board': chess.Board(),
-                'move_info': [],
-                'flipped': False,
-                'statusbar': "",
-                'engine': False,
-                'enginestatus': "Not doing anything",
-                'timedsearch': [True, False],
-                'timer': [START_TIME, START_TIME],
-                'movetimer': [0, 0],
-                'timerenabled': False,
-                'lasttimestamp': None,
-                'info': [],
-                'forcemove': False,
-                'moveready': False,
-                'nextmove': '',
-                'promotion': 'Q',
-                'commitmove': False,
-                'undo': False,
-                'nps': 0,
-                'depth': 0,
-                'seldepth': 0,
-                'autocommitenabled': True,
-                'movenotify': False,
-                'piecedisplay': 0,
-                'drift_compensation': round(INCREMENT) / 2,
-            }
-        self.state['lasttimestamp'] = datetime.datetime.now()
-        self.state['thinking'] = {}
-        # self.engine.info_handlers.append(InfoAppender(self.state))
+            self.engine.configure(uci)
+            self.engine.ping()
+        except chess.engine.EngineError as e:
+            logging.exception("Engine rejected the options")
+            self.state['selectedprofile'] = self.state['profile']
+            self.Notify(f"Profile {name} failed: {e}")
+            return
+        self.command_line = command_line
+        self.SwitchedProfile(name, start, "%d setoption" % len(uci))
+
+    # Quits the engine and starts it with command_line. If that fails, the
+    # previous command line is started again and the error returned; only
+    # if that fails too, it is raised.
+    def RestartEngine(self, command_line):
+        previous = self.command_line
+        self.engine.quit()
+        try:
+            self.StartEngine(command_line)
+        except Exception as e:
+            logging.exception("Engine failed to start")
+            self.StartEngine(previous)
+            return e
+        return None
 
-    def SaveState(self):
-        logging.info("Saving state")
-        with open(os.path.join(DATA_DIR, 'state.bin'), 'wb') as f:
-            pickle.dump(self.state, f)
+    # After the engine restart of a profile switch.
+    def FinishSwitch(self):
+        (name, start, how) = self.switching
+        self.switching = None
+        error = self.startup_tasks[0].result()
+        if error:
+            self.state['selectedprofile'] = self.state['profile']
+            self.Notify(f"Profile {name} failed: {error}")
+            return
+        self.SwitchedProfile(name, start, how)
+
+    def SwitchedProfile(self, name, start, how):
+        self.state['profile'] = name
+        self.state['profilestatus'] = "%s in %.2fs" % (how,
+                                                      time.monotonic() - start)
+        logging.info(f"Switched to profile {name}: "
+                     f"{self.state['profilestatus']}")
+        self.SaveState()
+
+    def SaveState(self, state=None):
+        if state is None:
+            state = self.state
+        self.unsaved.discard(state['game'])
+        if not self.save_states:
+            return
+        logging.info("Saving state of board %d" % (state['game'] + 1))
+        with open(StatePath(state['game']), 'wb') as f:
+            pickle.dump(state, f)
 
     def StopSearch(self):
         if self.search:
             self.search.stop()
 
-    def StartSearch(self):
+    def DiscardSearch(self):
         self.StopSearch()
-        self.state['forcemove'] = False
+        self.search = None
+        self.search_state = None
+        self.restart_at = None
+
+    # Saved with the next search or once the changes settle, so a burst of
+    # changes is written once.
+    def SaveSoon(self, state):
+        self.unsaved.add(state['game'])
+
+    # Writes what is still buffered, when the program exits.
+    def Shutdown(self):
+        self.FlushSaves()
+        if self.search_log:
+            self.search_log.Close()
 
-        if not self.state['engine']:
+    def FlushSaves(self):
+        for game in list(self.unsaved):
+            self.SaveState(self.games[game])
+
+    # Games where the engine has to make a timed move.
+    def WaitingGames(self):
+        return [
+            x for x in self.games
+            if x['engine'] and x['timedsearch'][SideToMove(x)]
+        ]
+
+    # The game that should have the engine: the waiting game with the least
+    # time left, otherwise infinite analysis, preferably of the game shown.
+    def PickGame(self):
+        waiting = self.WaitingGames()
+        if waiting:
+            return min(waiting, key=lambda x: x['timer'][SideToMove(x)])
+        analysing = [x for x in self.games if x['engine']]
+        if any(x is self.state for x in analysing):
+            return self.state
+        return analysing[0] if analysing else None
+
+    # While several games wait for a move, each one's clock is scaled by its
+    # share of their total remaining time before handing it to the engine.
+    def ClockShare(self, state):
+        waiting = self.WaitingGames()
+        if len(waiting) < 2:
+            return 1
+        total = sum(max(0, x['timer'][SideToMove(x)]) for x in waiting)
+        if total <= 0:
+            return 1 / len(waiting)
+        return max(0, state['timer'][SideToMove(state)]) / total
+
+    def SearchKey(self, state):
+        return (state['board'].fen(), state['engine']
+                and state['timedsearch'][SideToMove(state)])
+
+    # The position or settings of a game changed, so its search is stale.
+    # Analysis is left running until the changes settle for RESTART_DEBOUNCE
+    # seconds, then restarted once, or kept if it's still current. Timed
+    # searches, and analysis that becomes one, restart at once.
+    def Reschedule(self, state):
+        state['forcemove'] = False
+        if not self.search or self.search_state is not state:
             return
+        if self.search_limit is None and not self.SearchKey(state)[1]:
+            if self.restart_at is None:
+                self.restart_changes = 0
+            self.restart_changes += 1
+            self.restart_at = self.clock.Monotonic() + RESTART_DEBOUNCE
+            return
+        self.DiscardSearch()
+
+    def ResolveRestart(self):
+        changes = self.restart_changes
+        self.restart_at = None
+        if self.SearchKey(self.search_state) == self.search_key:
+            logging.info("Search still current after %d changes" % changes)
+            self.telemetry.OnRestartsAvoided(changes)
+            return
+        logging.info("Restarting search after %d changes" % changes)
+        self.telemetry.OnRestartsAvoided(changes - 1)
+        self.DiscardSearch()
 
-        if (self.state['board'].is_checkmate()
-                or self.state['board'].is_stalemate()):
+    def Schedule(self):
+        if not self.ready:
+            return
+        if self.search:
+            state = self.search_state
+            if not state['engine']:
+                logging.info("Aborted search manually")
+                self.DiscardSearch()
+                state['enginestatus'] = "Stopped."
+                self.SaveState(state)
+            elif self.search_limit is None and self.PickGame() is not state:
+                logging.info("Pausing analysis of board %d" %
+                             (state['game'] + 1))
+                self.DiscardSearch()
+                state['enginestatus'] = "Waiting for engine."
+            elif (self.restart_at is not None
+                  and self.clock.Monotonic() >= self.restart_at):
+                self.ResolveRestart()
+            if self.search:
+                if self.restart_at is None:
+                    self.FlushSaves()
+                return
+        state = self.PickGame()
+        if state is not None:
+            self.StartSearch(state)
+        self.FlushSaves()
+
+    def StartSearch(self, state):
+        self.StopSearch()
+        state['forcemove'] = False
+
+        if not state['engine']:
+            return
+
+        if (state['board'].is_checkmate()
+                or state['board'].is_stalemate()):
             logging.info("Terminal position, not searching")
-            self.state['timerenabled'] = False
-            self.state['engine'] = False
+            state['timerenabled'] = False
+            state['engine'] = False
             return
 
-        logging.info("Starting search")
-        self.SaveState()
+        logging.info("Starting search on board %d" % (state['game'] + 1))
+        self.SaveState(state)
 
-        self.state['thinking'] = {}
+        state['thinking'] = {}
         for key in ['nps', 'depth', 'seldepth']:
-            self.state[key] = 0
+            state[key] = 0
 
-        board = self.state['board']
+        board = state['board']
         idx = 0 if board.turn else 1
 
         limit = None
-        if self.state['timedsearch'][idx]:
+        budget = None
+        if state['timedsearch'][idx]:
             if self.opening_book:
                 try:
                     entry = self.opening_book.weighted_choice(
-                        self.state['board'])
+                        state['board'])
                     logging.info("Opening book hit: %s" % str(entry.move))
-                    idx = 0 if self.state['board'].turn else 1
-                    self.state['timer'][idx] += self.GetIncrement(
-                        self.state['board'].turn)
-                    self.state['board'].push(entry.move)
-                    self.state['move_info'].append('Still theory.')
-                    self.state['movetimer'][1 - idx] = 0
-                    self.state['nextmove'] = ''
-                    curses.flash()
-                    curses.beep()
-                    self.state['moveready'] = True
-                    self.StartSearch()
+                    idx = 0 if state['board'].turn else 1
+                    state['timer'][idx] += GetIncrement(
+                        state, state['board'].turn)
+                    state['board'].push(entry.move)
+                    state['move_info'].append('Still theory.')
+                    state['movetimer'][1 - idx] = 0
+                    state['nextmove'] = ''
+                    self.tui.Alert()
+                    state['moveready'] = True
+                    self.tui.scheduler.Urgent()
+                    self.StartSearch(state)
                     return
                 except IndexError:
                     pass
 
+            clocks = list(state['timer'])
+            share = self.ClockShare(state)
+            if share < 1:
+                logging.info("Sharing the engine, using %.2f of the clock" %
+                             share)
+                clocks[idx] *= share
+            budget = (max(0, clocks[idx]) * STABLE_MOVE_SHARE +
+                      GetIncrement(state, board.turn))
             limit = chess.engine.Limit(
-                white_clock=self.state['timer'][0],
-                black_clock=self.state['timer'][1],
-                white_inc=self.GetIncrement(chess.WHITE),
-                black_inc=self.GetIncrement(chess.BLACK))
+                white_clock=clocks[0],
+                black_clock=clocks[1],
+                white_inc=GetIncrement(state, chess.WHITE),
+                black_inc=GetIncrement(state, chess.BLACK))
             logging.info("Searching with time limit: %s" % str(limit))
-            self.state['enginestatus'] = "go w %d+%d b %d+%d" % tuple(
+            state['enginestatus'] = "go w %d+%d b %d+%d" % tuple(
                 int(x * 1000) for x in [
-                    self.state['timer'][0],
-                    self.GetIncrement(chess.WHITE), self.state['timer'][1],
-                    self.GetIncrement(chess.BLACK)
+                    clocks[0],
+                    GetIncrement(state, chess.WHITE), clocks[1],
+                    GetIncrement(state, chess.BLACK)
                 ])
         else:
-            self.state['enginestatus'] = "go infinite"
+            state['enginestatus'] = "go infinite"
+
+        multipv = MULTIPV
+        if self.state['movestats']:
+            multipv = MOVE_STATS_MULTIPV
+            self.move_stats.Reset()
+        self.BeginSearch(state, limit, budget, multipv)
+
+    # Bookkeeping of a new engine search, and the search itself.
+    def BeginSearch(self, state, limit, budget, multipv):
+        board = state['board']
+        self.search_limit = limit
+        self.search_budget = budget
+        self.search_multipv = multipv
+        self.search_infos = 0
+        self.stable_infos = 0
+        self.stable_stopped = False
+        self.stability.Reset()
+        state['stable'] = None
+        self.search_cost = 0
+        self.search_started = self.clock.Monotonic()
+        self.search_nodes = 0
+        self.telemetry.OnSearchStarted()
+        if self.search_log:
+            self.search_log.StartSearch()
 
         logging.info(f"Starting search, board=[{board.fen()}] limit={limit}")
+        self.search_key = self.SearchKey(state)
+        self.search_state = state
         self.search = self.engine.analysis(board=board,
                                            limit=limit,
-                                           multipv=MULTIPV)
+                                           multipv=multipv)
 
-    def GetIncrement(self, white_color):
-        if self.state['timedsearch'][0] == self.state['timedsearch'][1]:
-            return INCREMENT
-        if (white_color == chess.WHITE) == self.state['timedsearch'][0]:
-            return max(0, INCREMENT - self.state['drift_compensation'])
-        else:
-            return min(2 * INCREMENT,
-                       INCREMENT + self.state['drift_compensation'])
+    def DropMultiPv(self):
+        # Only for infinite searches: restarting a timed search would reset
+        # lc0's time manager for this move.
+        logging.info("Best move dominates (%.2f), restarting with MultiPV=1" %
+                     self.move_stats.dominance)
+        self.search.stop()
+        self.BeginSearch(self.search_state, None, None, 1)
 
     def CommitMove(self):
         self.state['commitmove'] = False
-        self.SaveState()
+        self.SaveSoon(self.state)
+        if self.entry_started is not None:
+            self.entry_times.append(time.monotonic() - self.entry_started)
+            self.entry_started = None
         nextmove = self.state['nextmove']
         if len(nextmove) == 4:
             from_sq = chess.SQUARE_NAMES.index(nextmove[:2])
@@ -176,20 +632,258 @@ class Controller:
         except:
             logging.exception("Bad move: %s" % nextmove)
             return
-        self.state['move_info'].append(self.GetBestWdl())
+        self.state['move_info'].append(self.GetBestWdl(self.state))
         self.state['thinking'] = {}
+        self.state['predicted'] = ''
+        if not self.state['timedsearch'][idx]:
+            # The opponent moved, the premove is used up either way.
+            self.state['premove'] = ''
 
-        self.state['timer'][idx] += self.GetIncrement(
-            not self.state['board'].turn)
+        self.state['timer'][idx] += GetIncrement(
+            self.state, not self.state['board'].turn)
         self.state['movetimer'][1 - idx] = 0
         self.state['nextmove'] = ''
-        self.StartSearch()
+        self.Reschedule(self.state)
+
+    # The opponent played the armed premove: it's committed in this tick, so
+    # the search starts before the next redraw.
+    def PlayPremove(self):
+        self.state['playpremove'] = False
+        premove = self.state['premove']
+        if premove in ['', '*']:
+            return
+        if chess.Move.from_uci(premove) not in self.state['board'].legal_moves:
+            logging.info("Premove %s is not legal here" % premove)
+            return
+        logging.info("Playing premove %s" % premove)
+        self.state['nextmove'] = premove
+        self.entry_started = None
+        self.CommitMove()
+        if self.entry_times:
+            logging.info("Premove saved %.2fs (median of %d manual entries)" %
+                         (statistics.median(self.entry_times[-20:]),
+                          len(self.entry_times[-20:])))
+        else:
+            logging.info("Premove played, no manual entries to compare with")
+
+    # Premove '*' stands for the engine's predicted reply to its move, known
+    # once the engine has moved.
+    def ResolvePremove(self):
+        if self.state['premove'] != '*':
+            return
+        if self.state['timedsearch'][SideToMove(self.state)]:
+            return
+        self.state['premove'] = self.state['predicted']
+        logging.info("Premove armed with predicted reply: %s" %
+                     (self.state['premove'] or 'none'))
+
+    def TrackMoveEntry(self):
+        if not self.state['nextmove']:
+            self.entry_started = None
+        elif self.entry_started is None:
+            self.entry_started = time.monotonic()
+
+    def ConfigureMoveStats(self):
+        enabled = self.state['movestats']
+        options = {'VerboseMoveStats': enabled, 'LogLiveStats': enabled}
+        if not all(x in self.engine.options for x in options):
+            logging.info("Engine doesn't support live move stats")
+            self.state['movestats'] = False
+            self.move_stats_configured = False
+            return
+        logging.info(f"Setting move stats: {enabled}")
+        self.DiscardSearch()
+        self.engine.configure(options)
+        self.move_stats_configured = enabled
+
+    def LogSearchCost(self):
+        logging.info("Search cost: movestats=%s multipv=%d nps=%d infos=%d "
+                     "info processing=%.1fms snapshots=%d" %
+                     (self.state['movestats'], self.search_multipv,
+                      self.search_state['nps'], self.search_infos,
+                      self.search_cost * 1000, self.move_stats.snapshots))
+
+    # Replaces the game on screen with a new one, for simulated games.
+    def NewGame(self):
+        self.DiscardSearch()
+        state = PrepareState(NewState(), self.state['game'])
+        for key in ENGINE_KEYS + ['profilenames']:
+            state[key] = self.state[key]
+        state['enginestatus'] = self.state['enginestatus']
+        state['lasttimestamp'] = self.clock.Now()
+        self.games[state['game']] = state
+        self.state = state
+        self.tui.SetState(state)
+        return state
+
+    def SwitchBoard(self):
+        state = self.games[(self.state['game'] + 1) % len(self.games)]
+        for key in ENGINE_KEYS:
+            state[key] = self.state[key]
+        logging.info("Switching to board %d" % (state['game'] + 1))
+        self.state = state
+        self.tui.SetState(state)
+
+    # Looks up the shown position in the preparation database when it changes.
+    def UpdatePrepared(self):
+        if not self.prep_db:
+            return
+        board = self.state['board']
+        key = self.PositionKey(self.state)
+        if self.prep_keys.get(self.state['game']) == key:
+            return
+        self.prep_keys[self.state['game']] = key
+        self.state['prepared'] = self.prep_db.Lookup(board)
+        if self.state['prepared']:
+            logging.info(f"Prepared position: {board.fen()}")
+
+    # Looks up the shown position in the game database while the explorer is
+    # open. Only the headers of the listed games are read from the PGN.
+    def UpdateExplorer(self):
+        if not self.state['explorer']:
+            self.explorer_keys.pop(self.state['game'], None)
+            return
+        key = self.PositionKey(self.state)
+        if self.explorer_keys.get(self.state['game']) == key:
+            return
+        self.explorer_keys[self.state['game']] = key
+        if not self.pgn_index:
+            self.state['explorerinfo'] = {'error': "No game database."}
+            return
+        board = self.state['board']
+        res = self.pgn_index.Lookup(board, EXPLORER_GAMES)
+        if res is None:
+            self.state['explorerinfo'] = {'error': "Position not in database."}
+            return
+        self.state['explorerinfo'] = {
+            'games': res['games'],
+            'moves': [(board.san(move), w, d, l)
+                      for move, w, d, l in res['moves']],
+            'list': [GameLine(self.pgn_index.Headers(x)) for x in res['refs']],
+        }
+
+    # Identifies the shown position for the caches of lookups on it, also
+    # when several plies were replaced between checks.
+    def PositionKey(self, state):
+        board = state['board']
+        return (len(board.move_stack), chess.polyglot.zobrist_hash(board))
+
+    def UpdateLivePgn(self):
+        for state, pgn in zip(self.games, self.live_pgn):
+            pgn.Sync(state)
+
+    def UpdateMoveIndex(self):
+        key = self.PositionKey(self.state)
+        if self.move_index_keys.get(self.state['game']) == key:
+            return
+        self.move_index_keys[self.state['game']] = key
+        self.state['moveindex'] = MoveIndex(self.state['board'])
+
+    def UpdateBoardSummary(self):
+        if len(self.games) < 2:
+            return
+        waiting = self.WaitingGames()
+        res = []
+        for state in self.games:
+            if state['moveready']:
+                tag = 'READY'
+            elif self.search and self.search_state is state:
+                tag = 'think'
+            elif any(x is state for x in waiting):
+                tag = 'wait'
+            else:
+                tag = ''
+            num = state['game'] + 1
+            res.append(f"[{num}]{tag}" if state is self.state else
+                       f" {num} {tag}")
+        self.state['boards'] = ' '.join(res)
+
+    # Shows message in the status bar until a move is played or undone on
+    # that board, or the seconds pass.
+    def Notify(self, message, seconds=NOTICE_SECONDS):
+        if self.notice:
+            self.notice[0]['statusbar'] = ''
+        self.state['statusbar'] = message
+        self.notice = (self.state, self.clock.Monotonic() + seconds,
+                       len(self.state['board'].move_stack))
+        self.tui.scheduler.Urgent()
+
+    def UpdateNotice(self):
+        if self.profile_done:
+            (message, self.profile_done) = (self.profile_done, None)
+            self.Notify(message)
+        if self.notice is None:
+            return
+        (state, expiry, plies) = self.notice
+        if (self.clock.Monotonic() >= expiry
+                or len(state['board'].move_stack) != plies):
+            state['statusbar'] = ''
+            self.notice = None
+            self.tui.scheduler.Urgent()
+
+    def StartProfile(self):
+
+        def Done(message):
+            self.profile_done = message
+
+        if self.sampler.Start(PROFILE_SECONDS, Done):
+            self.Notify(f"Profiling for {PROFILE_SECONDS}s...",
+                        PROFILE_SECONDS)
+
+    def UpdateWhatIf(self):
+        state = self.state
+        if state['whatif'] and state['whatif'][0]['base'] != state[
+                'board'].fen():
+            logging.info("Position changed, dropping what-if lines")
+            for line in state['whatif']:
+                line['cancelled'] = True
+            state['whatif'] = []
+            state['whatifview'] = 0
+        if state['whatifview']:
+            # Redrawn when the analysis thread updates the line on screen.
+            line = state['whatif'][state['whatifview'] - 1]
+            shown = (line['status'], id(line['thinking']))
+            if shown != self.whatif_shown:
+                self.whatif_shown = shown
+                self.tui.scheduler.Invalidate()
+        if not state['whatifadd']:
+            return
+        try:
+            move = chess.Move.from_uci(state['whatifadd'])
+        except ValueError:
+            move = None
+        state['whatifadd'] = ''
+        if not self.whatif:
+            self.Notify("No what-if engine configured.")
+            return
+        if move not in state['board'].legal_moves:
+            self.Notify("What-if move is not legal.")
+            return
+        line = NewLine(state['board'], move)
+        state['whatif'].append(line)
+        state['whatifview'] = len(state['whatif'])
+        self.whatif.Add(line)
 
     def Update(self):
+        if self.state['startprofile']:
+            self.state['startprofile'] = False
+            self.StartProfile()
+        self.UpdateNotice()
+        if self.state['switchboard']:
+            self.state['switchboard'] = False
+            self.SwitchBoard()
+        # Engine changes wait until the engine has started.
+        if self.ready and (self.state['movestats'] !=
+                           self.move_stats_configured):
+            self.ConfigureMoveStats()
+        if self.ready and self.state['switchprofile']:
+            name = self.state['switchprofile']
+            self.state['switchprofile'] = None
+            self.SwitchProfile(name)
         if self.state['undo']:
             logging.info("Undo move")
             self.state['undo'] = False
-            self.SaveState()
+            self.SaveSoon(self.state)
             if self.state['board'].move_stack:
                 idx = 0 if self.state['board'].turn else 1
                 self.state['movetimer'][1 - idx] = 0
@@ -197,64 +891,136 @@ class Controller:
                 self.state['move_info'].pop()
                 self.state['nextmove'] = ''
                 self.state['thinking'] = {}
+                self.state['premove'] = ''
 
-                self.StartSearch()
+                self.Reschedule(self.state)
+        self.UpdateWhatIf()
+        self.ResolvePremove()
+        if self.state['playpremove']:
+            self.PlayPremove()
+        self.TrackMoveEntry()
         if self.state['commitmove']:
             self.CommitMove()
         if self.state['forcemove']:
             self.state['forcemove'] = False
             logging.info("Forcemove, sending stop")
             self.SaveState()
-            self.StopSearch()
-        if self.state['engine'] and not self.search:
-            self.StartSearch()
-        if not self.state['engine'] and self.search:
-            logging.info("Aborted search manually")
-            self.StopSearch()
-            self.search = None
-            self.state['enginestatus'] = "Stopped."
-            self.SaveState()
+            if self.restart_at is not None:
+                # The move is played in the position on screen.
+                self.ResolveRestart()
+                self.Schedule()
+            if self.search_state is self.state:
+                if (self.state['stable'] or 0) >= STABLE_THRESHOLD:
+                    self.LogTimeSaved(self.state, "Forced settled move")
+                self.StopSearch()
+        self.Schedule()
 
     def UpdateTimer(self):
-        newtime = datetime.datetime.now()
-        if self.state['timerenabled']:
-            idx = 0 if self.state['board'].turn else 1
-            delta = (newtime - self.state['lasttimestamp']
-                     ) / datetime.timedelta(seconds=1)
-            self.state['timer'][idx] -= delta
-            self.state['movetimer'][idx] += delta
-        self.state['lasttimestamp'] = newtime
+        newtime = self.clock.Now()
+        for state in self.games:
+            if state['timerenabled']:
+                idx = 0 if state['board'].turn else 1
+                delta = (newtime - state['lasttimestamp']
+                         ) / datetime.timedelta(seconds=1)
+                state['timer'][idx] -= delta
+                state['movetimer'][idx] += delta
+            state['lasttimestamp'] = newtime
 
     def UpdateSearchInfo(self):
-        if not self.search:
+        # Infos of a search that may be restarted wait in the queue.
+        if not self.search or self.restart_at is not None:
             return
 
-        thinking = self.state['thinking']
+        state = self.search_state
+        thinking = state['thinking']
+        start = time.perf_counter()
+        infos = 0
 
         while not self.search.empty():
             info = self.search.get()
-            if 'curr' not in thinking or ('time' in info and info['time'] > thinking['curr']['time']):   
+            infos += 1
+            self.tui.scheduler.Invalidate()
+            lag = None
+            if 'time' in info:
+                lag = self.clock.Monotonic() - self.search_started - info['time']
+                if 'nps' in info:
+                    self.search_nodes = int(info['nps'] * info['time'])
+            self.telemetry.OnInfo(info, lag)
+            if 'string' in info:
+                if self.state['movestats']:
+                    self.move_stats.Feed(info['string'], thinking,
+                                         state['board'])
+                continue
+            # Once move stats arrive, they own thinking['curr'].
+            if 'curr' not in thinking or (
+                    not thinking.get('movestats') and 'time' in info
+                    and info['time'] > thinking['curr']['time']):
                 thinking['prev'] = thinking.get('curr', {'time': 0})
-                thinking['curr'] = {"time": info['time'], "moves": {}, "pv":[]}
+                thinking['curr'] = {"time": info.get('time', 0), "moves": {}, "pv":[],
+                                    "pvs": {}}
             for key in ['nps', 'depth', 'seldepth']:
                 if key in info:
-                    self.state[key] = info[key]
+                    state[key] = info[key]
             if not info.get('pv', None):
                 continue
+            if self.search_log:
+                self.search_log.Add(state['game'], state['board'], info)
             if info.get('multipv', 1) == 1:
                 thinking['curr']['pv'] = info['pv']
+            # Every line's PV, as ints until the Thinking pane shows it.
             move = info['pv'][0].uci()
+            thinking['curr'].setdefault('pvs', {})[move] = [
+                EncodeMove(x) for x in info['pv']
+            ]
+            if thinking.get('movestats'):
+                continue
             thinking['curr']['moves'][move] = {
                 'score': info['score'].white() if 'score' in info else None,
                 'wdl': info['wdl'].white() if 'wdl' in info else None,
                 'nodes': info.get('nodes', 0),
             }
 
-    def GetBestWdl(self):
-        if 'curr' not in self.state['thinking']: return "(unknown)"
-        if not self.state['thinking']['curr'].get('moves'):
+        if infos:
+            self.search_infos += infos
+            self.search_cost += time.perf_counter() - start
+        if (self.state['movestats'] and self.search_limit is None
+                and self.search_multipv > 1
+                and not self.search.inner._finished.done()
+                and self.move_stats.dominance > MOVE_STATS_DOMINANCE):
+            self.DropMultiPv()
+
+    # Whether the best move of a timed search has settled.
+    def UpdateStability(self):
+        if (not self.search or self.search_budget is None
+                or self.search_infos == self.stable_infos):
+            return
+        self.stable_infos = self.search_infos
+        state = self.search_state
+        elapsed = self.clock.Monotonic() - self.search_started
+        state['stable'] = self.stability.Feed(
+            state['thinking'].get('curr', {}).get('moves', {}),
+            state['board'].turn, elapsed, self.search_budget, state['nps'])
+        if (STABLE_AUTO_STOP and not self.stable_stopped
+                and elapsed >= STABLE_MIN_TIME
+                and (state['stable'] or 0) >= STABLE_THRESHOLD):
+            self.stable_stopped = True
+            self.LogTimeSaved(state, "Stopping settled move")
+            self.StopSearch()
+
+    def LogTimeSaved(self, state, what):
+        elapsed = self.clock.Monotonic() - self.search_started
+        saved = max(0, self.search_budget - elapsed)
+        state['stablesaved'] += saved
+        logging.info("%s %s after %.1fs (confidence %.3f): ~%.1fs saved, "
+                     "%.1fs this game" %
+                     (what, self.stability.best, elapsed, state['stable'],
+                      saved, state['stablesaved']))
+
+    def GetBestWdl(self, state):
+        if 'curr' not in state['thinking']: return "(unknown)"
+        if not state['thinking']['curr'].get('moves'):
             return "(unknown)"
-        return max(self.state['thinking']['curr']['moves'].values(),
+        return max(state['thinking']['curr']['moves'].values(),
                    key=lambda x: x['nodes']).get('wdl', '(unknown)')
 
 
@@ -273,31 +1039,95 @@ class Controller:
         if not self.search.inner._finished.done():
             return
 
+        state = self.search_state
         self.UpdateSearchInfo()
-        curses.flash()
-        curses.beep()
-        self.state['moveready'] = True
-        idx = 0 if self.state['board'].turn else 1
-        self.state['timer'][idx] += self.GetIncrement(self.state['board'].turn)
-        self.state['movetimer'][1 - idx] = 0
+        self.LogSearchCost()
+        if self.search_log:
+            self.search_log.Flush()
+        state['alert'] = self.telemetry.OnMove(
+            self.search_nodes, self.clock.Monotonic() - self.search_started,
+            state['nps']) or ''
+        self.tui.Alert()
+        state['moveready'] = True
+        self.tui.scheduler.Urgent()
+        if self.wire_trace:
+            self.wire_trace.Mark('moveready')
+            self.move_shown_pending = True
+        idx = 0 if state['board'].turn else 1
+        state['timer'][idx] += GetIncrement(state, state['board'].turn)
+        state['movetimer'][1 - idx] = 0
         best_move = self.search.wait()
-        self.state['board'].push(best_move.move)
-        self.state['move_info'].append(self.GetBestWdl())
-        self.state['nextmove'] = ''
-        self.state['thinking'] = {}
-        self.state['enginestatus'] = "Stopped."
+        pv = state['thinking'].get('curr', {}).get('pv', [])
+        state['predicted'] = (pv[1].uci() if len(pv) >= 2
+                              and pv[0] == best_move.move else '')
+        state['board'].push(best_move.move)
+        state['move_info'].append(self.GetBestWdl(state))
+        state['nextmove'] = ''
+        state['thinking'] = {}
+        state['enginestatus'] = "Stopped."
         self.search = None
-        self.StartSearch()
+        self.search_state = None
+        self.Schedule()
 
-    def Run(self, stdscr):
-        self.tui = Tui(stdscr, self.state)
+    # Acts on the keys and the engine, once per loop.
+    def Step(self):
+        self.Update()
+        self.UpdateSearchInfo()
+        self.UpdateStability()
+        self.UpdateOnSearchDone()
+        self.UpdateLivePgn()
+
+    # Without a screen the UI runs in its own process (SPLIT_UI).
+    def Run(self, stdscr=None):
+        if stdscr is None:
+            self.tui = UiServer(os.path.join(DATA_DIR, UI_SOCKET), self.state,
+                                self.games)
+        else:
+            self.tui = Tui(stdscr, self.state)
+        scheduler = self.tui.scheduler
+        first_frame = True
         while True:
+            self.CheckStartup()
             self.UpdateTimer()
-            self.tui.Process()
-            self.tui.Draw()
-            self.Update()
-            self.UpdateSearchInfo()
-            self.UpdateOnSearchDone()
+            if self.relay:
+                self.state['termbps'] = self.relay.bps
+            # Keys are checked against the position on screen now.
+            self.UpdateMoveIndex()
+            self.tui.Process(scheduler.WaitTime())
+            self.Step()
+            if scheduler.FrameDue(self.search is not None):
+                self.UpdateBoardSummary()
+                self.UpdatePrepared()
+                self.UpdateExplorer()
+                start = time.perf_counter()
+                self.tui.Draw()
+                self.telemetry.OnFrame(time.perf_counter() - start)
+                if first_frame:
+                    first_frame = False
+                    self.timeline.Mark('first frame')
+                if self.move_shown_pending:
+                    self.move_shown_pending = False
+                    self.wire_trace.Mark('shown')
+                if self.broadcast:
+                    self.broadcast.Publish(self.state)
+
+
+# Controller of simulated games (./main.py --simulate, see wccc/simulate.py):
+# the stub engine in virtual time, with its files in data_dir.
+# Only what the clocks depend on is kept: one line of analysis, and no files
+# written per move.
+def SimulationController(data_dir, clock, book):
+    global DATA_DIR, OPENING_BOOK, BOARDS, MULTIPV, SEARCH_LOG, LIVE_PGN
+    DATA_DIR = data_dir
+    OPENING_BOOK = book
+    BOARDS = 1
+    MULTIPV = 1
+    SEARCH_LOG = None
+    LIVE_PGN = None
+    controller = Controller(
+        clock, STUB_COMMAND_LINE + ['--virtual', '--info-interval=1000'])
+    controller.save_states = False
+    return controller
 
 
 def main():
@@ -315,12 +1145,67 @@ def main():
         level=logging.DEBUG)
     logging.info('=' * 60 + ' Started!')
 
+    if SPLIT_UI and '--ui' in sys.argv[1:]:
+        RunUi()
+        return
+
+    if '--simulate' in sys.argv[1:]:
+        from wccc import simulate
+        simulate.main(SimulationController)
+        return
+
     controller = Controller()
+    if TELEMETRY_PORT:
+        controller.telemetry.StartHttp(TELEMETRY_PORT)
+    if TELEMETRY_TEXTFILE:
+        controller.telemetry.StartTextfile(
+            os.path.join(LOGS_DIR, 'telemetry.prom'), TELEMETRY_INTERVAL,
+            TELEMETRY_HISTORY_BYTES, TELEMETRY_HISTORY_BACKUPS)
+
+    # Started from the main loop, like Shift+F.
+    signal.signal(
+        signal.SIGUSR1,
+        lambda signum, frame: controller.state.update(startprofile=True))
+
+    if SPLIT_UI:
+        print(f"Engine controller running, start the UI with {sys.argv[0]} "
+              f"--ui")
+        try:
+            controller.Run()
+        finally:
+            controller.Shutdown()
+        return
 
     def Run(stdscr):
         controller.Run(stdscr)
 
-    curses.wrapper(Run)
+    if REMOTE_MODE:
+        controller.relay = TerminalRelay(max_bps=REMOTE_SIMULATED_BPS)
+        if not controller.relay.Start():
+            controller.relay = None
+    try:
+        curses.wrapper(Run)
+    finally:
+        controller.Shutdown()
+        if controller.relay:
+            controller.relay.Stop()
+
+
+def RunUi():
+    relay = None
+    if REMOTE_MODE:
+        relay = TerminalRelay(max_bps=REMOTE_SIMULATED_BPS)
+        if not relay.Start():
+            relay = None
+
+    def Run(stdscr):
+        RunUiClient(stdscr, os.path.join(DATA_DIR, UI_SOCKET), relay)
+
+    try:
+        curses.wrapper(Run)
+    finally:
+        if relay:
+            relay.Stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# Headless engine-vs-engine match between two engine configurations, for
+# tuning search parameters. Games are played in parallel, each game pair
+# starts from the same book opening with colours reversed, and the clocks
+# are kept the same way the TUI keeps them.
+#
+#   ./match.py wccc cpuct=1.9,fpu-value=0.3 --games=400 --concurrency=8 \
+#       --tc=10+0.1 --book=WCSC.bin --sprt=0,5
+#
+# An engine configuration is a profile name from profiles.json or a comma
+# separated list of flag=value applied on top of COMMAND_LINE.
+
+import argparse
+import logging
+import math
+import os
+import queue
+import random
+import threading
+import time
+import chess
+import chess.engine
+import chess.pgn
+import chess.polyglot
+from wccc import profiles
+from wccc import rules
+from wccc.config import *
+from main import BASE_DIR, NewState, SideToMove, GetIncrement
+
+
+def ParseEngine(spec, all_profiles):
+    if spec in all_profiles:
+        return all_profiles[spec]
+    profile = {}
+    for item in spec.split(','):
+        (flag, eq, value) = item.strip().lstrip('-').partition('=')
+        profile[flag] = value if eq else True
+    return profile
+
+
+def ParseTimeControl(tc):
+    (start, _, increment) = tc.partition('+')
+    return (float(start), float(increment or 0))
+
+
+def PickOpening(book, plies, rnd):
+    board = chess.Board()
+    for _ in range(plies):
+        try:
+            entry = book.weighted_choice(board, random=rnd)
+        except IndexError:
+            break
+        board.push(entry.move)
+    return board.move_stack
+
+
+def Elo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return 400 * math.log10(score / (1 - score))
+
+
+def EloToScore(elo):
+    return 1 / (1 + 10**(-elo / 400))
+
+
+class MatchStats:
+
+    def __init__(self, elo0, elo1, alpha, beta):
+        self.wins = self.draws = self.losses = 0
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self.start = time.monotonic()
+
+    def Add(self, score):
+        if score == 1:
+            self.wins += 1
+        elif score == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    def Games(self):
+        return self.wins + self.draws + self.losses
+
+    def Score(self):
+        return (self.wins + self.draws / 2) / self.Games()
+
+    # Variance of the score of one game.
+    def Variance(self):
+        s = self.Score()
+        return (self.wins * (1 - s)**2 + self.draws * (0.5 - s)**2 +
+                self.losses * s**2) / self.Games()
+
+    # Elo difference with its 95% confidence margin.
+    def Elo(self):
+        s = self.Score()
+        margin = 1.96 * math.sqrt(self.Variance() / self.Games())
+        return (Elo(s), (Elo(s + margin) - Elo(s - margin)) / 2)
+
+    # Log likelihood ratio of elo1 against elo0, with the trinomial score
+    # distribution approximated by a normal one.
+    def Llr(self):
+        var = self.Variance()
+        if var == 0:
+            return 0
+        s0 = EloToScore(self.elo0)
+        s1 = EloToScore(self.elo1)
+        return (self.Games() * (s1 - s0) * (2 * self.Score() - s0 - s1) /
+                (2 * var))
+
+    def SprtDone(self):
+        return self.Games() and not self.lower < self.Llr() < self.upper
+
+    def GamesPerHour(self):
+        return self.Games() * 3600 / max(1e-9, time.monotonic() - self.start)
+
+    def Report(self):
+        if not self.Games():
+            return "No games finished."
+        (elo, margin) = self.Elo()
+        llr = self.Llr()
+        verdict = ''
+        if llr >= self.upper:
+            verdict = ' H1 accepted'
+        elif llr <= self.lower:
+            verdict = ' H0 accepted'
+        return (f"Games {self.Games()}: +{self.wins} ={self.draws} "
+                f"-{self.losses}  Elo {elo:+.1f} +/- {margin:.1f}  "
+                f"LLR {llr:.2f} [{self.lower:.2f}, {self.upper:.2f}] "
+                f"({self.elo0:g}, {self.elo1:g}){verdict}  "
+                f"{self.GamesPerHour():.1f} games/h")
+
+
+class Match:
+
+    def __init__(self, args):
+        self.args = args
+        (self.start_time, self.increment) = ParseTimeControl(args.tc)
+        all_profiles = profiles.LoadProfiles(
+            os.path.join(BASE_DIR, PROFILES_FILE))
+        base = STUB_COMMAND_LINE if args.stub else COMMAND_LINE
+        self.command_lines = [
+            profiles.ApplyProfile(base, ParseEngine(x, all_profiles))
+            for x in [args.engine1, args.engine2]
+        ]
+        self.names = [args.engine1, args.engine2]
+        (elo0, elo1) = (float(x) for x in args.sprt.split(','))
+        self.stats = MatchStats(elo0, elo1, args.alpha, args.beta)
+        self.stopped = threading.Event()
+        self.jobs = queue.Queue()
+        self.done = queue.Queue()
+
+        rnd = random.Random(args.seed)
+        book = None
+        if args.book:
+            book = chess.polyglot.open_reader(os.path.join(
+                BASE_DIR, args.book))
+        for pair in range((args.games + 1) // 2):
+            opening = (PickOpening(book, args.book_plies, rnd)
+                       if book else [])
+            for flip in range(2):
+                if pair * 2 + flip < args.games:
+                    self.jobs.put((pair * 2 + flip, opening, flip))
+
+    def StartEngine(self, idx):
+        return chess.engine.SimpleEngine.popen_uci(
+            self.command_lines[idx],
+            timeout=60,
+            cwd=None if self.args.stub else LC0_DIRECTORY)
+
+    # Plays one game; engines[0] has white. Returns (result, termination,
+    # board).
+    def PlayGame(self, engines, opening, game_id):
+        state = NewState()
+        state['timedsearch'] = [True, True]
+        state['timer'] = [self.start_time, self.start_time]
+        board = state['board']
+        for move in opening:
+            board.push(move)
+        while True:
+            (result, label) = rules.Termination(board)
+            if label:
+                # Engines would claim the draw.
+                return (result or '1/2-1/2', label, board)
+            idx = SideToMove(state)
+            limit = chess.engine.Limit(
+                white_clock=state['timer'][0],
+                black_clock=state['timer'][1],
+                white_inc=GetIncrement(state, chess.WHITE, self.increment),
+                black_inc=GetIncrement(state, chess.BLACK, self.increment))
+            start = time.monotonic()
+            play = engines[idx].play(board, limit, game=game_id)
+            elapsed = time.monotonic() - start
+            state['timer'][idx] -= elapsed
+            state['movetimer'][idx] += elapsed
+            loss = '0-1' if board.turn == chess.WHITE else '1-0'
+            if state['timer'][idx] < 0:
+                return (loss, 'TIME FORFEIT', board)
+            if play.move is None:
+                return (loss, 'RESIGNED', board)
+            state['timer'][idx] += GetIncrement(state, board.turn,
+                                                self.increment)
+            state['movetimer'][1 - idx] = 0
+            board.push(play.move)
+
+    def Worker(self):
+        engines = [self.StartEngine(0), self.StartEngine(1)]
+        try:
+            while not self.stopped.is_set():
+                try:
+                    (game_id, opening, flip) = self.jobs.get_nowait()
+                except queue.Empty:
+                    return
+                order = [1, 0] if flip else [0, 1]
+                (result, termination,
+                 board) = self.PlayGame([engines[x] for x in order], opening,
+                                        game_id)
+                self.done.put((game_id, order, result, termination, board))
+        finally:
+            for engine in engines:
+                engine.quit()
+
+    def SaveGame(self, game_id, order, result, termination, board):
+        game = chess.pgn.Game.from_board(board)
+        game.headers['Event'] = 'wccc match'
+        game.headers['Round'] = str(game_id + 1)
+        game.headers['White'] = self.names[order[0]]
+        game.headers['Black'] = self.names[order[1]]
+        game.headers['Result'] = result
+        game.headers['Termination'] = termination
+        game.headers['TimeControl'] = self.args.tc
+        with open(self.args.pgn, 'a') as f:
+            print(game, file=f, end='\n\n')
+
+    def Run(self):
+        threads = [
+            threading.Thread(target=self.Worker, daemon=True)
+            for _ in range(self.args.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(x.is_alive() for x in threads) or not self.done.empty():
+                try:
+                    (game_id, order, result, termination,
+                     board) = self.done.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                # Scores are from the point of view of engine1.
+                score = {'1-0': 1, '0-1': 0}.get(result, 0.5)
+                self.stats.Add(score if order[0] == 0 else 1 - score)
+                if self.args.pgn:
+                    self.SaveGame(game_id, order, result, termination, board)
+                logging.info(f"Game {game_id + 1}: {result} {termination}")
+                print(self.stats.Report(), flush=True)
+                if self.args.stop_on_sprt and self.stats.SprtDone():
+                    print("SPRT finished, stopping.")
+                    break
+        finally:
+            # Running games are finished but not counted.
+            self.stopped.set()
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(
+        description='Engine vs engine match with SPRT.')
+    parser.add_argument('engine1', help='Profile name or flag=value,...')
+    parser.add_argument('engine2', help='Profile name or flag=value,...')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=os.cpu_count())
+    parser.add_argument('--tc',
+                        default='10+0.1',
+                        help='Time control, seconds+increment')
+    parser.add_argument('--book', default=OPENING_BOOK)
+    parser.add_argument('--book-plies', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--sprt',
+                        default='0,5',
+                        help='elo0,elo1 of the hypotheses')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--stop-on-sprt', action='store_true')
+    parser.add_argument('--pgn', help='Append the games to this file')
+    parser.add_argument('--stub',
+                        action='store_true',
+                        help='Use the stub engine instead of lc0')
+    args = parser.parse_args()
+    match = Match(args)
+    match.Run()
+    print(match.stats.Report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# Read-only view of the board on screen for spectators (BROADCAST_SOCKET):
+# team members, the arbiter liaison or a stream, without access to the
+# operator's terminal. Viewers connect to a unix socket (forward it with ssh
+# for remote ones) and get a full snapshot of the state, then deltas of what
+# changed, at most every BROADCAST_INTERVAL seconds each.
+#
+# Without viewers nothing is done. Otherwise the state is copied once per
+# interval, and each delta is computed once for all viewers that saw the same
+# previous snapshot. Sockets are non-blocking; a viewer that hasn't read its
+# last message is skipped until it has.
+#
+#   python3 -m wccc.broadcast data/broadcast.sock
+
+import argparse
+import copy
+import curses
+import logging
+import os
+import select
+import socket
+import time
+import chess
+from .uilink import Pack, FrameReader
+
+# What the widgets draw; keys only used to act on key presses aren't sent.
+BROADCAST_KEYS = [
+    'alert', 'autocommitenabled', 'board', 'boards', 'depth',
+    'drift_compensation', 'engine', 'enginestatus', 'explorer',
+    'explorerinfo', 'flipped', 'framerate', 'framesskipped', 'move_info',
+    'movenotify', 'moveready', 'movestats', 'movetimer', 'nps',
+    'piecedisplay', 'premove', 'prepared', 'profile', 'profilestatus',
+    'promotion', 'pvexpand', 'seldepth', 'selectedprofile', 'stable',
+    'statusbar', 'termbps', 'thinking', 'timedsearch', 'timer',
+    'timerenabled', 'whatif', 'whatifview'
+]
+
+
+# The broadcast keys of state as plain values, boards as their root position
+# and moves.
+def Encode(state):
+    res = {}
+    for key in BROADCAST_KEYS:
+        if key not in state:
+            continue
+        value = state[key]
+        if isinstance(value, chess.Board):
+            res[key] = {
+                'fen': value.root().fen(),
+                'moves': list(value.move_stack)
+            }
+        elif key == 'whatif':
+            # The what-if thread replaces the values of a line, never changes
+            # them, so a shallow copy taken at once is a consistent one.
+            res[key] = copy.deepcopy([dict(x) for x in value])
+        else:
+            res[key] = copy.deepcopy(value)
+    return res
+
+
+# What changed from old to new, None if nothing did. Dicts are compared key
+# by key and lists by common prefix, so a new move or search info only sends
+# what's new.
+def Diff(old, new):
+    if type(old) is dict and type(new) is dict:
+        changes = {}
+        for key, value in new.items():
+            if key not in old:
+                changes[key] = ('=', value)
+            else:
+                diff = Diff(old[key], value)
+                if diff is not None:
+                    changes[key] = diff
+        removed = [x for x in old if x not in new]
+        if not changes and not removed:
+            return None
+        return ('{', changes, removed)
+    if type(old) is list and type(new) is list:
+        n = 0
+        while n < min(len(old), len(new)) and old[n] == new[n]:
+            n += 1
+        if n == len(old) == len(new):
+            return None
+        return ('[', n, new[n:])
+    if type(old) is type(new) and old == new:
+        return None
+    return ('=', new)
+
+
+def Patch(value, diff):
+    if diff[0] == '=':
+        return diff[1]
+    if diff[0] == '[':
+        return value[:diff[1]] + diff[2]
+    (_, changes, removed) = diff
+    for key in removed:
+        del value[key]
+    for key, change in changes.items():
+        value[key] = Patch(value.get(key), change)
+    return value
+
+
+class Viewer:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.out = b''
+        # Snapshot version the viewer has, None before the first one.
+        self.version = None
+        self.sent = 0
+
+
+class BroadcastServer:
+
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.viewers = []
+        self.version = 0
+        # Snapshots that viewers still have, by version.
+        self.snapshots = {}
+        if os.path.exists(path):
+            os.unlink(path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        os.chmod(path, 0o600)
+        self.listener.listen(8)
+        self.listener.setblocking(False)
+        logging.info(f"Broadcasting on {path}")
+
+    def Accept(self):
+        while True:
+            try:
+                (conn, _) = self.listener.accept()
+            except BlockingIOError:
+                return
+            conn.setblocking(False)
+            self.viewers.append(Viewer(conn))
+            logging.info("Viewer connected, %d watching" % len(self.viewers))
+
+    def Drop(self, viewer):
+        viewer.conn.close()
+        self.viewers.remove(viewer)
+        logging.info("Viewer disconnected, %d watching" % len(self.viewers))
+
+    def Send(self, viewer):
+        try:
+            sent = viewer.conn.send(viewer.out)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.Drop(viewer)
+            return
+        viewer.out = viewer.out[sent:]
+
+    # Called after each frame.
+    def Publish(self, state):
+        self.Accept()
+        if not self.viewers:
+            self.snapshots = {}
+            return
+        # Viewers only send to notice when they go away.
+        (readable, _, _) = select.select([x.conn for x in self.viewers], [],
+                                         [], 0)
+        for viewer in list(self.viewers):
+            if viewer.conn in readable:
+                try:
+                    data = viewer.conn.recv(4096)
+                except OSError:
+                    data = b''
+                if not data:
+                    self.Drop(viewer)
+            elif viewer.out:
+                self.Send(viewer)
+        now = time.monotonic()
+        due = [
+            x for x in self.viewers
+            if not x.out and now - x.sent >= self.interval
+        ]
+        if not due:
+            return
+
+        snapshot = Encode(state)
+        latest = self.snapshots.get(self.version)
+        if latest is None or Diff(latest, snapshot) is not None:
+            self.version += 1
+            self.snapshots[self.version] = snapshot
+        messages = {}
+        for viewer in due:
+            if viewer.version == self.version:
+                continue
+            if viewer.version not in messages:
+                if viewer.version is None:
+                    msg = {'full': snapshot}
+                else:
+                    msg = {
+                        'diff':
+                        Diff(self.snapshots[viewer.version],
+                             self.snapshots[self.version])
+                    }
+                messages[viewer.version] = Pack(msg)
+            viewer.out = messages[viewer.version]
+            viewer.version = self.version
+            viewer.sent = now
+            self.Send(viewer)
+        used = {x.version for x in self.viewers} | {self.version}
+        self.snapshots = {
+            k: v
+            for k, v in self.snapshots.items() if k in used
+        }
+
+
+# Brings a viewer's board to the broadcast root position and moves.
+def SyncBoard(board, encoded):
+    if board is None or board.root().fen() != encoded['fen']:
+        board = chess.Board(encoded['fen'])
+    moves = encoded['moves']
+    n = 0
+    while (n < min(len(moves), len(board.move_stack))
+           and board.move_stack[n] == moves[n]):
+        n += 1
+    while len(board.move_stack) > n:
+        board.pop()
+    for move in moves[n:]:
+        board.push(move)
+    return board
+
+
+def RunViewer(stdscr, path):
+    from .tui import Tui
+    conn = None
+    reader = FrameReader()
+    encoded = None
+    board = None
+    tui = None
+    while True:
+        if conn is None:
+            try:
+                conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                conn.connect(path)
+                reader = FrameReader()
+                encoded = None
+            except OSError:
+                conn = None
+                if tui is None:
+                    stdscr.addstr(0, 0,
+                                  f"Waiting for the broadcast on {path}...")
+                    stdscr.refresh()
+                else:
+                    tui.state['statusbar'] = "Broadcast ended, retrying."
+                    tui.Draw()
+                time.sleep(1)
+                continue
+
+        changed = False
+        while select.select([conn], [], [], 0)[0]:
+            try:
+                data = conn.recv(1 << 20)
+            except OSError:
+                data = b''
+            if not data:
+                conn.close()
+                conn = None
+                break
+            for msg in reader.Feed(data):
+                if 'full' in msg:
+                    encoded = msg['full']
+                elif encoded is not None:
+                    encoded = Patch(encoded, msg['diff'])
+                changed = True
+        if changed and encoded is not None:
+            board = SyncBoard(board, encoded['board'])
+            state = dict(encoded, board=board, nextmove='', moveindex=None)
+            if tui is None:
+                stdscr.clear()
+                tui = Tui(stdscr, state)
+            else:
+                tui.SetState(state)
+        if tui is None:
+            time.sleep(0.05)
+            continue
+        # The view is read-only, keys only quit or resize.
+        key = tui.ReadKey(tui.scheduler.WaitTime())
+        if key in (3, curses.KEY_RESIZE):
+            tui.HandleKey(key)
+        if tui.scheduler.FrameDue(False):
+            tui.Draw()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read-only game viewer.')
+    parser.add_argument('path', help='Broadcast socket of the controller')
+    args = parser.parse_args()
+    curses.wrapper(RunViewer, args.path)
+
+
+if __name__ == "__main__":
+    main()
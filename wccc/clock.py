@@ -0,0 +1,31 @@
+import datetime
+import time
+
+# Where the controller gets the time for the game clocks and searches from.
+# Simulated games (wccc/simulate.py) use a VirtualClock that only moves when
+# told to, so a whole game takes as long as its moves take to compute.
+
+
+class SystemClock:
+
+    def Now(self):
+        return datetime.datetime.now()
+
+    def Monotonic(self):
+        return time.monotonic()
+
+
+class VirtualClock:
+
+    def __init__(self):
+        self.start = datetime.datetime(2000, 1, 1)
+        self.seconds = 0.0
+
+    def Now(self):
+        return self.start + datetime.timedelta(seconds=self.seconds)
+
+    def Monotonic(self):
+        return self.seconds
+
+    def Advance(self, seconds):
+        self.seconds += seconds
@@ -1,4 +1,5 @@
 import os
+import sys
 import datetime
 
 LC0_DIRECTORY = '/home/wccc/lc0/build/release'
@@ -50,6 +51,103 @@ COMMAND_LINE = [
     '--score-type=Q',
 ]
 
+# Named sets of flags applied on top of COMMAND_LINE, switchable from the TUI
+# (Shift+P to select, Ctrl+P to apply) without restarting the engine.
+PROFILES_FILE = 'profiles.json'
+ENGINE_PROFILE = 'default'
+
+# Per-move node/policy/Q/WDL statistics for all root moves, parsed from lc0's
+# verbose move stats instead of a MultiPV line per move (Shift+S toggles).
+MOVE_STATS = False
+MOVE_STATS_INTERVAL = 0.5  # Seconds between parsed snapshots.
+MOVE_STATS_MULTIPV = 3
+# Node share of the best move after which infinite analysis drops to 1 PV.
+MOVE_STATS_DOMINANCE = 0.9
+
+# Stable best move detection in timed searches, see wccc/stability.py. Above
+# STABLE_THRESHOLD confidence the best move is shown as settled, and with
+# STABLE_AUTO_STOP the search is stopped there as if forced.
+STABLE_THRESHOLD = 0.95
+STABLE_AUTO_STOP = False
+STABLE_MIN_TIME = 1.0  # Seconds searched before stopping automatically.
+STABLE_WINDOW = 2.0  # Seconds the node rate trend is taken over.
+STABLE_SWING = 0.01  # Share of nps the second move may gain on top of it.
+STABLE_WDL_MARGIN = 0.02  # Expected score gap in favour of the second move.
+# Share of the clock the engine is assumed to use on a move, plus the
+# increment.
+STABLE_MOVE_SHARE = 1 / 20
+
+# Search telemetry in Prometheus text format: served on
+# http://127.0.0.1:TELEMETRY_PORT/metrics and/or written every
+# TELEMETRY_INTERVAL seconds to logs/telemetry.prom plus a rotating history.
+TELEMETRY_PORT = None  # 9469
+TELEMETRY_TEXTFILE = False
+TELEMETRY_INTERVAL = 15
+TELEMETRY_HISTORY_BYTES = 10 * 1024 * 1024
+TELEMETRY_HISTORY_BACKUPS = 5
+# Alert when a move's NPS drops below this fraction of the recent median.
+TELEMETRY_SLOWDOWN_RATIO = 0.7
+
+# Every search info with a PV, stored column-wise in the data directory for
+# post-game analysis (python3 -m wccc.searchlog data/searchlog summary).
+SEARCH_LOG = 'searchlog'
+
+# Shift+F (or kill -USR1) samples the stacks of every thread for
+# PROFILE_SECONDS and writes logs/profile-*.collapsed plus a summary.
+PROFILE_SECONDS = 10
+PROFILE_INTERVAL = 0.005  # Seconds between samples.
+
+# Record every UCI line with its timestamp to logs/wire-*.bin, for
+# python3 -m wccc.wiretrace to break down where each move's time went.
+WIRE_TRACE = False
+
+# Second engine that analyses what-if moves (Shift+I) next to the main
+# search, e.g. with a small net or --backend=eigen so it doesn't take GPU time
+# from the game. None disables it (the stub engine is used with
+# USE_STUB_ENGINE).
+WHATIF_COMMAND_LINE = None
+WHATIF_NODES = 100000  # Node budget per line.
+WHATIF_MULTIPV = 5
+
+# Play against a fake engine instead of lc0, for trying out the TUI without
+# GPUs. Profile flags are passed to it but ignored.
+USE_STUB_ENGINE = False
+STUB_COMMAND_LINE = [
+    sys.executable,
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stubengine.py'),
+    '--nps=20000',
+]
+
+# Number of games played at once against the one engine (Shift+G switches the
+# board shown). Each game is saved to its own state file.
+BOARDS = 1
+
+# Run the engine controller and the curses UI as separate processes:
+# ./main.py starts the controller, ./main.py --ui the UI, which can be
+# restarted without interrupting the search.
+SPLIT_UI = False
+UI_SOCKET = 'ui.sock'  # In the data directory.
+
+# Read-only view for spectators, watched with
+# python3 -m wccc.broadcast data/broadcast.sock
+BROADCAST_SOCKET = None  # 'broadcast.sock', in the data directory.
+BROADCAST_INTERVAL = 0.5  # Seconds between updates sent to a viewer.
+
+# Preparation database in the data directory, built with
+# python3 -m wccc.prepdb data/prep.bin import <file.pgn|file.epd>
+PREP_DB = 'prep.bin'
+
+# Game database for the opening explorer (Shift+O), an index directory in the
+# data directory built with
+# python3 -m wccc.pgnindex data/pgnindex build <files.pgn>
+PGN_INDEX = 'pgnindex'
+EXPLORER_GAMES = 8  # Games listed under the moves.
+
+# PGN of each game kept up to date in the data directory as moves are played,
+# for organisers and broadcast tools (live.pgn, live-1.pgn for the second
+# board...).
+LIVE_PGN = 'live.pgn'
+
 START_TIME = 5 * 60.0
 INCREMENT = 5.0
 OPENING_BOOK = None
@@ -63,6 +161,31 @@ OPENING_BOOK = 'plutie.bin'  # For tie breaks, and for speed chess
 #OPENING_BOOK = 'wccc2022.bin'
         
 STATUS = "Speed chess games"
+
+# Clock (in seconds) below which our time is shown in red and the screen is
+# redrawn at FRAME_RATE_LOW_TIME.
+LOW_TIME = 120
+# Frame rate budgets: nothing changed or engine stopped / searching.
+FRAME_RATE_IDLE = 2
+FRAME_RATE_SEARCH = 15
+FRAME_RATE_LOW_TIME = 60
+# Seconds a message stays in the status bar in place of the PV, unless a move
+# is played first.
+NOTICE_SECONDS = 8
+
+# Changes to the analysed position within this many seconds of each other (a
+# few undos, an undo and a different move) restart the analysis once, and not
+# at all if they end in the same position. Timed searches restart at once.
+RESTART_DEBOUNCE = 0.3
+
+# Remote mode, for running the TUI over a slow SSH link: caps the frame rate,
+# uses ASCII glyphs and shows bytes per second written to the terminal.
+# Started with LC0TUI_REMOTE=1 ./main.py.
+REMOTE_MODE = os.environ.get('LC0TUI_REMOTE') == '1'
+REMOTE_MAX_FPS = 10
+REMOTE_ASCII = True
+# Throttle terminal output to this many bytes/s to simulate a slow link.
+REMOTE_SIMULATED_BPS = None  # 56000 // 8
 # WCSC - using zz's T75 tune
 #    '--cpuct=1.9',
 #    '--cpuct-base=45669',
@@ -0,0 +1,188 @@
+import datetime
+import logging
+import os
+import chess
+import chess.engine
+import chess.pgn
+import chess.polyglot
+from . import config
+from . import rules
+
+# PGN of a game as it is played (LIVE_PGN), for organisers and broadcast tools
+# that tail the file. Each move is appended with its clock and the engine's
+# WDL in a comment, overwriting only the result at the end; an undo truncates
+# the file back to where the undone move started. The file always ends in a
+# result, so it is a valid PGN between writes.
+#
+# The cost per move is constant. The file is rewritten in full only when the
+# controller starts, and when a game starts or ends.
+
+
+def Clock(seconds):
+    seconds = max(0, int(seconds))
+    return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60,
+                             seconds % 60)
+
+
+# Text of move in board, the position before it. A line per move pair.
+def MoveText(board, move, clock, info, first):
+    if board.turn == chess.WHITE:
+        text = f'\n{board.fullmove_number}. '
+    else:
+        # Black's moves follow a comment.
+        text = f' {board.fullmove_number}... '
+    if first:
+        text = text[1:]
+    text += board.san(move)
+    comment = []
+    if clock is not None:
+        comment.append(f'[%clk {Clock(clock)}]')
+    if isinstance(info, chess.engine.Wdl):
+        comment.append(f'[%wdl {info.wins},{info.draws},{info.losses}]')
+    elif info:
+        comment.append(str(info).replace('}', ')'))
+    if comment:
+        text += ' { ' + ' '.join(comment) + ' }'
+    return text
+
+
+# (root fen, [(move, clock)]) of a game written before a restart.
+def ReadClocks(path):
+    try:
+        with open(path) as f:
+            game = chess.pgn.read_game(f)
+    except OSError:
+        return None, []
+    if game is None:
+        return None, []
+    return (game.board().fen(), [(x.move, x.clock())
+                                 for x in game.mainline()])
+
+
+class LivePgn:
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.root = None
+        self.result = None
+        # Plies written: their moves, clocks, and the offsets where their
+        # text starts, plus one for the end of the last one.
+        self.moves = []
+        self.clocks = []
+        self.offsets = []
+        # Hash of the position after the plies written.
+        self.hash = None
+
+    def Headers(self, state, result):
+        board = state['board'].root()
+        headers = {
+            'Event': config.STATUS,
+            'Site': '?',
+            'Date': datetime.date.today().strftime('%Y.%m.%d'),
+            'Round': '?',
+            'White': 'Lc0' if state['timedsearch'][0] else '?',
+            'Black': 'Lc0' if state['timedsearch'][1] else '?',
+            'Result': result,
+            'TimeControl': '%d+%d' % (config.START_TIME, config.INCREMENT),
+        }
+        if board.fen() != chess.STARTING_FEN:
+            headers['SetUp'] = '1'
+            headers['FEN'] = board.fen()
+        return ''.join(f'[{k} "{v}"]\n' for k, v in headers.items()) + '\n'
+
+    # Side that played ply i.
+    def Side(self, board, i):
+        return (i + (0 if board.root().turn else 1)) % 2
+
+    # Writes the whole game. Clocks are kept for the moves written before,
+    # also by an earlier run; of the others, only the last move of each side
+    # gets the current clock.
+    def Rewrite(self, state):
+        board = state['board']
+        if self.file is None:
+            (root, written) = ReadClocks(self.path)
+        else:
+            (root, written) = (self.root, list(zip(self.moves, self.clocks)))
+        if root != board.root().fen():
+            written = []
+        self.result = board.result() if board.is_game_over() else '*'
+        self.root = board.root().fen()
+        self.moves = []
+        self.clocks = []
+        text = self.Headers(state, self.result)
+        self.offsets = [len(text.encode('utf-8'))]
+        parts = [text]
+        replay = board.root()
+        for i, move in enumerate(board.move_stack):
+            if i < len(written) and written[i][0] == move:
+                clock = written[i][1]
+            elif i >= len(board.move_stack) - 2:
+                clock = state['timer'][self.Side(board, i)]
+            else:
+                clock = None
+            parts.append(self.Ply(state, replay, i, clock))
+            replay.push(move)
+        parts.append(f' {self.result}\n')
+        if self.file:
+            self.file.close()
+        with open(self.path + '.tmp', 'wb') as f:
+            f.write(''.join(parts).encode('utf-8'))
+        os.replace(self.path + '.tmp', self.path)
+        self.file = open(self.path, 'r+b')
+        self.hash = chess.polyglot.zobrist_hash(board)
+        logging.info(f"Wrote {self.path}, {len(self.moves)} plies")
+
+    # Text of ply i, recorded as written.
+    def Ply(self, state, board, i, clock):
+        move = state['board'].move_stack[i]
+        info = state['move_info'][i] if i < len(state['move_info']) else None
+        text = MoveText(board, move, clock, info, i == 0)
+        self.moves.append(move)
+        self.clocks.append(clock)
+        self.offsets.append(self.offsets[-1] + len(text.encode('utf-8')))
+        return text
+
+    # Plies of the game still written. Pushed moves leave the position after
+    # the written ones in place, anything else is compared from the start.
+    def Kept(self, stack, board):
+        n = len(self.moves)
+        if (n <= len(stack) and (not n or stack[n - 1] == self.moves[-1])
+                and rules.HashAt(board, n) == self.hash):
+            return n
+        n = 0
+        while (n < min(len(stack), len(self.moves))
+               and stack[n] == self.moves[n]):
+            n += 1
+        return n
+
+    # Brings the file up to date after moves or undos, called every tick.
+    def Sync(self, state):
+        board = state['board']
+        stack = board.move_stack
+        if (self.file and len(stack) == len(self.moves)
+                and (not stack or stack[-1] == self.moves[-1])):
+            return
+        if (self.file is None or board.root().fen() != self.root
+                or self.result != '*' or board.is_game_over()):
+            self.Rewrite(state)
+            return
+        n = self.Kept(stack, board)
+        del self.moves[n:]
+        del self.clocks[n:]
+        del self.offsets[n + 1:]
+        # Only the new moves are copied and replayed.
+        replay = board.copy(stack=len(stack) - n)
+        for _ in range(len(stack) - n):
+            replay.pop()
+        parts = []
+        for i in range(n, len(stack)):
+            parts.append(
+                self.Ply(state, replay, i,
+                         state['timer'][self.Side(board, i)]))
+            replay.push(stack[i])
+        self.file.seek(self.offsets[n])
+        self.file.write((''.join(parts) + f' {self.result}\n').encode('utf-8'))
+        self.file.truncate()
+        self.file.flush()
+        self.hash = chess.polyglot.zobrist_hash(board)
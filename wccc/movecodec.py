@@ -0,0 +1,13 @@
+import chess
+
+# Moves as 16 bit integers, for files and in-memory lists of many moves (the
+# preparation and game databases, the search log, PVs of MultiPV lines): from
+# square, to square and promotion piece type, 6, 6 and 4 bits.
+
+
+def EncodeMove(move):
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def DecodeMove(x):
+    return chess.Move(x & 63, (x >> 6) & 63, (x >> 12) or None)
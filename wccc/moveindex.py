@@ -0,0 +1,52 @@
+import chess
+
+# Legal moves of a position keyed by every prefix of their UCI and of their
+# SAN as typed into MoveInput: lower case and without 'x', '+', '#' and '='
+# ('x' toggles timed search and upper case keys are shortcuts). Castling can
+# also be typed as a king move, 'o' adjusts the clock. Built once per ply.
+#
+# Dropping 'x' and the case makes some SAN the same, like bxc4 and Bc4, and a
+# pawn's e4 is a prefix of the moves of a piece on e4. Such a text completes
+# to the pawn move, the one listed first; the piece move is typed as UCI.
+
+
+def TypedSan(san):
+    return ''.join(x for x in san.lower() if x not in 'x+#=')
+
+
+class MoveIndex:
+
+    def __init__(self, board):
+        self.san = {}
+        # Typed SAN to the move it completes to.
+        self.typed = {}
+        prefixes = {}
+        for move in board.legal_moves:
+            uci = move.uci()
+            self.san[uci] = board.san(move)
+            typed = TypedSan(self.san[uci])
+            if (typed not in self.typed
+                    or board.piece_type_at(move.from_square) == chess.PAWN):
+                self.typed[typed] = uci
+            keys = [uci, typed]
+            if board.is_castling(move):
+                keys.append('k' + chess.square_name(move.to_square))
+            for key in keys:
+                for i in range(1, len(key) + 1):
+                    prefixes.setdefault(key[:i], set()).add(uci)
+        self.prefixes = {k: sorted(v) for k, v in prefixes.items()}
+
+    # UCI of the legal moves that the typed text can still become, the one it
+    # completes to first.
+    def Candidates(self, text):
+        if not text:
+            return sorted(self.san)
+        candidates = self.prefixes.get(text, [])
+        if text in self.typed:
+            move = self.typed[text]
+            candidates = [move] + [x for x in candidates if x != move]
+        return candidates
+
+    # UCI of the move the text is the full typed SAN of, or None.
+    def Complete(self, text):
+        return self.typed.get(text)
@@ -0,0 +1,112 @@
+import re
+import time
+import chess
+import chess.engine
+
+# Parses lc0's verbose move stats, sent as "info string" lines on every info
+# when LogLiveStats is on, e.g.:
+#   d2d4  (293 ) N:     580 (+ 6) (P: 13.60%) (WL:  0.03453) (D: 0.603) ...
+#   node  ( 20) N:    4187 (+ 0) (P: 0.00%) (WL:  0.04102) (D: 0.598) ...
+# The "node" line for the root ends each snapshot.
+
+MOVE_RE = re.compile(r'^[a-h][1-8][a-h][1-8][qrbn]?$')
+NODES_RE = re.compile(r'N:\s*(\d+)')
+FIELD_RE = re.compile(r'\((\w+):\s*([^)]*)\)')
+
+
+def ParseFloat(value):
+    try:
+        return float(value.rstrip('%'))
+    except ValueError:
+        # Unvisited moves show "-.-----".
+        return None
+
+
+def ParseMoveStatsLine(line):
+    (move, _, rest) = line.strip().partition(' ')
+    if move != 'node' and not MOVE_RE.match(move):
+        return None
+    nodes = NODES_RE.search(rest)
+    if not nodes:
+        return None
+    fields = {k: ParseFloat(v) for k, v in FIELD_RE.findall(rest)}
+    return (move, int(nodes.group(1)), fields)
+
+
+def MoveStatsEntry(nodes, fields, turn):
+    (wl, d, q) = (fields.get('WL'), fields.get('D'), fields.get('Q'))
+    score = wdl = None
+    if q is not None:
+        score = chess.engine.PovScore(chess.engine.Cp(round(q * 10000)),
+                                      turn).white()
+    if wl is not None and d is not None:
+        w = round(500 * (1 + wl - d))
+        d = round(1000 * d)
+        wdl = chess.engine.PovWdl(chess.engine.Wdl(w, d, 1000 - w - d),
+                                  turn).white()
+    return {
+        'score': score,
+        'wdl': wdl,
+        'nodes': nodes,
+        'policy': fields.get('P'),
+    }
+
+
+class MoveStatsCollector:
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.Reset()
+
+    def Reset(self):
+        self.start = time.monotonic()
+        self.last_applied = None
+        self.moves = {}
+        self.skipping = False
+        self.in_snapshot = False
+        self.dominance = 0
+        self.snapshots = 0
+
+    # Returns True when a complete snapshot was applied to thinking.
+    def Feed(self, line, thinking, board):
+        now = time.monotonic()
+        if not self.in_snapshot:
+            # Whole snapshots are skipped when they come faster than the
+            # interval, without parsing.
+            self.in_snapshot = True
+            self.skipping = (self.last_applied is not None
+                             and now - self.last_applied < self.interval)
+            self.moves = {}
+        if self.skipping:
+            if line.startswith('node '):
+                self.in_snapshot = False
+            return False
+        parsed = ParseMoveStatsLine(line)
+        if parsed is None:
+            return False
+        (move, nodes, fields) = parsed
+        if move != 'node':
+            if board.piece_type_at(chess.parse_square(move[:2])) == chess.KING:
+                # lc0 sends castling as king-takes-rook.
+                try:
+                    move = board.parse_uci(move).uci()
+                except ValueError:
+                    return False
+            self.moves[move] = MoveStatsEntry(nodes, fields, board.turn)
+            return False
+
+        self.in_snapshot = False
+        self.last_applied = now
+        self.snapshots += 1
+        if nodes and self.moves:
+            self.dominance = max(x['nodes']
+                                 for x in self.moves.values()) / nodes
+        thinking['prev'] = thinking.get('curr', {'time': 0})
+        thinking['curr'] = {
+            'time': now - self.start,
+            'moves': self.moves,
+            'pv': thinking['prev'].get('pv', []),
+            'pvs': thinking['prev'].get('pvs', {}),
+        }
+        thinking['movestats'] = True
+        return True
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# Game database over PGN files, for the opening explorer (Shift+O). The PGN
+# files stay as they are; the index records where each game starts, and for
+# every position up to --depth plies, keyed by its polyglot Zobrist hash, the
+# results after each move played from it and the games that reached it.
+# Games are only read from the PGN, by byte offset, when they're shown.
+#
+#   python3 -m wccc.pgnindex data/pgnindex build src.pgn twic*.pgn [--jobs=8]
+#   python3 -m wccc.pgnindex data/pgnindex show 'fen...'
+#
+# Files are split into jobs of whole games, parsed in parallel. Building
+# again only parses games appended to a file since the last build (a file
+# that changed otherwise is indexed from scratch). Each build adds a chunk
+# per file to the index directory, listed in index.json:
+#   header, then the columns in SECTIONS, each sorted by hash.
+
+import argparse
+import array
+import bisect
+import io
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import re
+import struct
+import chess
+import chess.pgn
+import chess.polyglot
+from .movecodec import EncodeMove, DecodeMove
+
+MAGIC = b'WCCCPGI1'
+HEADER = struct.Struct('<8sQQQ')  # magic, games, stats, refs
+# (name, array typecode, count), 8 byte columns first to keep them aligned.
+SECTIONS = [
+    ('game_offset', 'Q', 'games'),
+    ('stat_hash', 'Q', 'stats'),  # Per (position, move played).
+    ('ref_hash', 'Q', 'refs'),  # Per (position, game).
+    ('game_length', 'I', 'games'),
+    ('stat_white', 'I', 'stats'),
+    ('stat_draw', 'I', 'stats'),
+    ('stat_black', 'I', 'stats'),
+    ('ref_game', 'I', 'refs'),
+    ('stat_move', 'H', 'stats'),
+    ('game_result', 'B', 'games'),
+]
+MANIFEST = 'index.json'
+RESULTS = {'1-0': 0, '1/2-1/2': 1, '0-1': 2}
+UNKNOWN_RESULT = 3
+# Games start after a blank line, with a tag.
+GAME_SEPARATOR = re.compile(rb'\n[ \t\r]*\n(?=\[)')
+GAME_END = re.compile(rb'(1-0|0-1|1/2-1/2|\*)\s*$')
+JOB_BYTES = 4 << 20
+# Bytes of the start of a file checked to tell appended from rewritten.
+HEAD_BYTES = 4096
+
+
+class PositionVisitor(chess.pgn.BaseVisitor):
+
+    def __init__(self, depth):
+        self.depth = depth
+        self.result_tag = '*'
+        self.positions = []
+
+    def visit_header(self, tagname, tagvalue):
+        if tagname == 'Result':
+            self.result_tag = tagvalue
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def visit_move(self, board, move):
+        if len(board.move_stack) < self.depth:
+            self.positions.append(
+                (chess.polyglot.zobrist_hash(board), EncodeMove(move)))
+
+    def handle_error(self, error):
+        logging.debug(f"Skipping the rest of a game: {error}")
+
+    def result(self):
+        return (RESULTS.get(self.result_tag, UNKNOWN_RESULT), self.positions)
+
+
+# Parses the games of one job, in a worker process.
+def ScanGames(job):
+    (path, games, depth) = job
+    stats = {}
+    refs = []
+    results = []
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for i, (offset, length) in enumerate(games):
+                text = data[offset:offset + length].decode('utf-8', 'replace')
+                (result, positions) = chess.pgn.read_game(
+                    io.StringIO(text),
+                    Visitor=lambda: PositionVisitor(depth)) or (
+                        UNKNOWN_RESULT, [])
+                results.append(result)
+                seen = set()
+                for key, move in positions:
+                    # Repeated positions count once per game.
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    refs.append((key, i))
+                    if result != UNKNOWN_RESULT:
+                        stats.setdefault((key, move), [0, 0, 0])[result] += 1
+    return (results, stats, refs)
+
+
+# Complete games in data[begin:end], as (offset, length), and where the
+# next build has to start.
+def FindGames(data, begin, end):
+    starts = [begin] + [
+        x.end() for x in GAME_SEPARATOR.finditer(data, begin, end)
+    ]
+    games = [(x, y - x) for x, y in zip(starts, starts[1:] + [end])]
+    scanned = end
+    if games and not GAME_END.search(data[games[-1][0]:end]):
+        # Still being written.
+        scanned = games.pop()[0]
+    return ([x for x in games if data[x[0]:x[0] + x[1]].strip()], scanned)
+
+
+def LoadManifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'depth': None, 'next_chunk': 0, 'files': {}}
+
+
+def WriteChunk(path, games, results, stats, refs):
+    keys = sorted(stats)
+    refs.sort()
+    columns = {
+        'game_offset': [x[0] for x in games],
+        'game_length': [x[1] for x in games],
+        'game_result': results,
+        'stat_hash': [x[0] for x in keys],
+        'stat_move': [x[1] for x in keys],
+        'stat_white': [stats[x][0] for x in keys],
+        'stat_draw': [stats[x][1] for x in keys],
+        'stat_black': [stats[x][2] for x in keys],
+        'ref_hash': [x[0] for x in refs],
+        'ref_game': [x[1] for x in refs],
+    }
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(games), len(keys), len(refs)))
+        for name, typecode, _ in SECTIONS:
+            array.array(typecode, columns[name]).tofile(f)
+    os.replace(path + '.tmp', path)
+
+
+def Build(args):
+    os.makedirs(args.index, exist_ok=True)
+    manifest = LoadManifest(args.index)
+    if manifest['depth'] != args.depth:
+        # Everything is indexed again with the new depth.
+        for entry in manifest['files'].values():
+            for name in entry['chunks']:
+                os.unlink(os.path.join(args.index, name))
+        manifest['files'] = {}
+        manifest['depth'] = args.depth
+
+    jobs = []
+    plans = []
+    for path in map(os.path.abspath, args.pgn):
+        entry = manifest['files'].get(path)
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if not size:
+                continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if entry and (entry['scanned'] > size or data[:len(
+                        entry['head']) // 2].hex() != entry['head']):
+                    logging.warning(f"{path} changed, indexing it again")
+                    for name in entry['chunks']:
+                        os.unlink(os.path.join(args.index, name))
+                    entry = None
+                begin = entry['scanned'] if entry else 0
+                (games, scanned) = FindGames(data, begin, size)
+                head = data[:HEAD_BYTES].hex()
+        if entry is None:
+            entry = manifest['files'][path] = {'chunks': []}
+        entry['scanned'] = scanned
+        entry['head'] = head
+        if not games:
+            continue
+        first_job = len(jobs)
+        job = []
+        job_bytes = 0
+        for game in games:
+            job.append(game)
+            job_bytes += game[1]
+            if job_bytes >= JOB_BYTES:
+                jobs.append((path, job, args.depth))
+                (job, job_bytes) = ([], 0)
+        if job:
+            jobs.append((path, job, args.depth))
+        plans.append((path, games, first_job, len(jobs)))
+        print(f"{path}: {len(games)} new games")
+
+    with multiprocessing.Pool(args.jobs) as pool:
+        parsed = pool.map(ScanGames, jobs)
+
+    for path, games, first_job, end_job in plans:
+        results = []
+        stats = {}
+        refs = []
+        for job, (job_results, job_stats, job_refs) in zip(
+                jobs[first_job:end_job], parsed[first_job:end_job]):
+            refs += [(key, game + len(results)) for key, game in job_refs]
+            results += job_results
+            for key, value in job_stats.items():
+                total = stats.setdefault(key, [0, 0, 0])
+                for i in range(3):
+                    total[i] += value[i]
+        name = 'chunk-%05d.bin' % manifest['next_chunk']
+        manifest['next_chunk'] += 1
+        WriteChunk(os.path.join(args.index, name), games, results, stats,
+                   refs)
+        manifest['files'][path]['chunks'].append(name)
+        print(f"{name}: {len(games)} games, {len(stats)} moves, "
+              f"{len(refs)} positions")
+    with open(os.path.join(args.index, MANIFEST + '.tmp'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(os.path.join(args.index, MANIFEST + '.tmp'),
+               os.path.join(args.index, MANIFEST))
+
+
+class Chunk:
+
+    def __init__(self, path, pgn):
+        self.pgn = pgn
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, games, stats, refs) = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a PGN index chunk")
+        counts = {'games': games, 'stats': stats, 'refs': refs}
+        view = memoryview(self.data)
+        pos = HEADER.size
+        self.columns = {}
+        for name, typecode, count in SECTIONS:
+            size = counts[count] * struct.calcsize(typecode)
+            self.columns[name] = view[pos:pos + size].cast(typecode)
+            pos += size
+
+    def Range(self, column, key):
+        lo = bisect.bisect_left(self.columns[column], key)
+        return (lo, bisect.bisect_right(self.columns[column], key, lo))
+
+
+class PgnIndex:
+
+    def __init__(self, path):
+        manifest = LoadManifest(path)
+        self.chunks = [
+            Chunk(os.path.join(path, name), pgn)
+            for pgn, entry in manifest['files'].items()
+            for name in entry['chunks']
+        ]
+        self.pgn_files = {}
+
+    # Results of the moves played from the position, the number of games
+    # that reached it and references to the first max_refs of them.
+    def Lookup(self, board, max_refs=8):
+        key = chess.polyglot.zobrist_hash(board)
+        moves = {}
+        games = 0
+        refs = []
+        for chunk in self.chunks:
+            (lo, hi) = chunk.Range('stat_hash', key)
+            for i in range(lo, hi):
+                total = moves.setdefault(chunk.columns['stat_move'][i],
+                                         [0, 0, 0])
+                total[0] += chunk.columns['stat_white'][i]
+                total[1] += chunk.columns['stat_draw'][i]
+                total[2] += chunk.columns['stat_black'][i]
+            (lo, hi) = chunk.Range('ref_hash', key)
+            games += hi - lo
+            for i in range(lo, min(hi, lo + max_refs - len(refs))):
+                game = chunk.columns['ref_game'][i]
+                refs.append((chunk.pgn, chunk.columns['game_offset'][game],
+                             chunk.columns['game_length'][game]))
+        if not games:
+            return None
+        return {
+            'games': games,
+            'moves': sorted(((DecodeMove(k), *v) for k, v in moves.items()),
+                            key=lambda x: -sum(x[1:])),
+            'refs': refs,
+        }
+
+    def Text(self, ref):
+        (pgn, offset, length) = ref
+        if pgn not in self.pgn_files:
+            with open(pgn, 'rb') as f:
+                self.pgn_files[pgn] = mmap.mmap(f.fileno(),
+                                                0,
+                                                access=mmap.ACCESS_READ)
+        return self.pgn_files[pgn][offset:offset + length].decode(
+            'utf-8', 'replace')
+
+    def Headers(self, ref):
+        return chess.pgn.read_headers(io.StringIO(self.Text(ref)))
+
+    def Game(self, ref):
+        return chess.pgn.read_game(io.StringIO(self.Text(ref)))
+
+
+def GameLine(headers):
+    return (f"{headers.get('White', '?')} - {headers.get('Black', '?')} "
+            f"{headers.get('Result', '*')} {headers.get('Date', '')}")
+
+
+def Show(args):
+    index = PgnIndex(args.index)
+    board = chess.Board(args.fen)
+    res = index.Lookup(board)
+    if res is None:
+        print("Position not in the database")
+        return
+    print(f"{res['games']} games")
+    for move, w, d, l in res['moves']:
+        print(f"{board.san(move):7} {w + d + l:8} "
+              f"{100 * (w + d / 2) / (w + d + l):5.1f}%  +{w} ={d} -{l}")
+    for ref in res['refs']:
+        print(GameLine(index.Headers(ref)))
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description='PGN game database index.')
+    parser.add_argument('index', help='Index directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+    parser_build = commands.add_parser(
+        'build', help='Index new games of PGN files')
+    parser_build.add_argument('pgn', nargs='+')
+    parser_build.add_argument('--depth',
+                              type=int,
+                              default=30,
+                              help='Plies of each game to index')
+    parser_build.add_argument('--jobs', type=int, default=None)
+    parser_build.set_defaults(func=Build)
+    parser_show = commands.add_parser('show', help='Explore a position')
+    parser_show.add_argument('fen', nargs='?', default=chess.STARTING_FEN)
+    parser_show.set_defaults(func=Show)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
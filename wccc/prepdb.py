@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# Opening preparation database: per-move nodes, WDL, score and PV from deep
+# analysis done before the round, keyed by the polyglot Zobrist hash of the
+# position. The file is memory-mapped, a lookup is a probe into an open
+# addressing hash table followed by decoding one record.
+#
+#   python3 -m wccc.prepdb data/prep.bin import openings.pgn --nodes=2000000
+#   python3 -m wccc.prepdb data/prep.bin show 'fen...'
+#
+# Layout: header, NUM_SLOTS slots of (key, offset, length), then records.
+
+import argparse
+import logging
+import mmap
+import os
+import struct
+import chess
+import chess.engine
+import chess.pgn
+import chess.polyglot
+from .movecodec import EncodeMove, DecodeMove
+
+MAGIC = b'WCCCPRP1'
+HEADER = struct.Struct('<8sQ')  # magic, number of slots
+SLOT = struct.Struct('<QQI4x')  # key, offset, length
+MOVE = struct.Struct('<HQHHHiBB')  # move, nodes, w, d, l, score, kind, pv len
+PV_MOVE = struct.Struct('<H')
+
+SCORE_NONE = 0
+SCORE_CP = 1
+SCORE_MATE = 2
+
+
+def EncodeRecord(moves):
+    res = [struct.pack('<B', len(moves))]
+    for uci, move in moves.items():
+        score = move['score']
+        if score is None:
+            (kind, value) = (SCORE_NONE, 0)
+        elif score.is_mate():
+            (kind, value) = (SCORE_MATE, score.mate())
+        else:
+            (kind, value) = (SCORE_CP, score.score())
+        wdl = move['wdl'] or chess.engine.Wdl(0, 0, 0)
+        pv = move.get('pv', [])[:255]
+        res.append(
+            MOVE.pack(EncodeMove(chess.Move.from_uci(uci)), move['nodes'],
+                      wdl.wins, wdl.draws, wdl.losses, value, kind, len(pv)))
+        res += [PV_MOVE.pack(EncodeMove(x)) for x in pv]
+    return b''.join(res)
+
+
+def DecodeRecord(data, offset):
+    moves = {}
+    (count, ) = struct.unpack_from('<B', data, offset)
+    offset += 1
+    for _ in range(count):
+        (move, nodes, w, d, l, value, kind,
+         pv_len) = MOVE.unpack_from(data, offset)
+        offset += MOVE.size
+        pv = [
+            DecodeMove(PV_MOVE.unpack_from(data, offset + i * PV_MOVE.size)[0])
+            for i in range(pv_len)
+        ]
+        offset += pv_len * PV_MOVE.size
+        score = None
+        if kind == SCORE_CP:
+            score = chess.engine.Cp(value)
+        elif kind == SCORE_MATE:
+            score = chess.engine.Mate(value)
+        moves[DecodeMove(move).uci()] = {
+            'score': score,
+            'wdl': chess.engine.Wdl(w, d, l) if w + d + l else None,
+            'nodes': nodes,
+            'pv': pv,
+        }
+    return moves
+
+
+class PrepDb:
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.num_slots) = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a preparation database")
+
+    def Close(self):
+        self.data.close()
+        self.file.close()
+
+    def Slots(self):
+        for i in range(self.num_slots):
+            (key, offset, length) = SLOT.unpack_from(self.data,
+                                                     HEADER.size + i * SLOT.size)
+            if length:
+                yield (key, offset)
+
+    # Returns {uci: {'score', 'wdl', 'nodes', 'pv'}} with white's point of
+    # view, or None.
+    def Lookup(self, board):
+        key = chess.polyglot.zobrist_hash(board)
+        idx = key & (self.num_slots - 1)
+        while True:
+            (slot_key, offset, length) = SLOT.unpack_from(
+                self.data, HEADER.size + idx * SLOT.size)
+            if not length:
+                return None
+            if slot_key == key:
+                return DecodeRecord(self.data, offset)
+            idx = (idx + 1) & (self.num_slots - 1)
+
+    def Entries(self):
+        return {key: DecodeRecord(self.data, offset)
+                for key, offset in self.Slots()}
+
+
+def Write(path, entries):
+    num_slots = 1
+    while num_slots < 2 * len(entries) + 1:
+        num_slots *= 2
+    slots = [(0, 0, 0)] * num_slots
+    records = []
+    offset = HEADER.size + num_slots * SLOT.size
+    for key, moves in entries.items():
+        record = EncodeRecord(moves)
+        idx = key & (num_slots - 1)
+        while slots[idx][2]:
+            idx = (idx + 1) & (num_slots - 1)
+        slots[idx] = (key, offset, len(record))
+        records.append(record)
+        offset += len(record)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, num_slots))
+        for slot in slots:
+            f.write(SLOT.pack(*slot))
+        for record in records:
+            f.write(record)
+    os.replace(path + '.tmp', path)
+
+
+def ReadPositions(path, plies):
+    if path.endswith('.pgn'):
+        with open(path) as f:
+            while True:
+                game = chess.pgn.read_game(f)
+                if game is None:
+                    return
+                board = game.board()
+                yield board.copy()
+                for move in list(game.mainline_moves())[:plies]:
+                    board.push(move)
+                    yield board.copy()
+    else:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield chess.Board(' '.join(line.split()[:4]) + ' 0 1')
+
+
+def Analyse(engine, board, nodes, multipv):
+    moves = {}
+    for info in engine.analyse(board, chess.engine.Limit(nodes=nodes),
+                               multipv=multipv):
+        if not info.get('pv'):
+            continue
+        moves[info['pv'][0].uci()] = {
+            'score': info['score'].white() if 'score' in info else None,
+            'wdl': info['wdl'].white() if 'wdl' in info else None,
+            'nodes': info.get('nodes', 0),
+            'pv': info['pv'],
+        }
+    return moves
+
+
+def Import(args):
+    from . import config
+    entries = {}
+    if os.path.exists(args.db):
+        db = PrepDb(args.db)
+        entries = db.Entries()
+        db.Close()
+    command_line = (config.STUB_COMMAND_LINE
+                    if config.USE_STUB_ENGINE else config.COMMAND_LINE)
+    engine = chess.engine.SimpleEngine.popen_uci(
+        command_line,
+        timeout=60,
+        cwd=None if config.USE_STUB_ENGINE else config.LC0_DIRECTORY)
+    seen = set()
+    try:
+        for board in ReadPositions(args.positions, args.plies):
+            key = chess.polyglot.zobrist_hash(board)
+            if key in seen or board.is_game_over():
+                continue
+            seen.add(key)
+            old = entries.get(key, {})
+            if old and max(x['nodes'] for x in old.values()) >= args.nodes:
+                continue
+            print(f"Analysing {board.fen()}")
+            moves = Analyse(engine, board, args.nodes, args.multipv)
+            if moves:
+                entries[key] = moves
+            # Written regularly, so that long imports can be resumed.
+            if len(seen) % 20 == 0:
+                Write(args.db, entries)
+    finally:
+        engine.quit()
+        Write(args.db, entries)
+    print(f"{len(entries)} positions in {args.db}")
+
+
+def Show(args):
+    board = chess.Board(args.fen)
+    moves = PrepDb(args.db).Lookup(board)
+    if moves is None:
+        print("Position not prepared")
+        return
+    for uci, move in sorted(moves.items(), key=lambda x: -x[1]['nodes']):
+        print(f"{board.san(chess.Move.from_uci(uci)):7} N={move['nodes']} "
+              f"score={move['score']} wdl={move['wdl']} "
+              f"pv={board.variation_san(move['pv'])}")
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(
+        description='Opening preparation database.')
+    parser.add_argument('db')
+    commands = parser.add_subparsers(dest='command', required=True)
+    parser_import = commands.add_parser(
+        'import', help='Analyse positions from a .pgn or .epd file')
+    parser_import.add_argument('positions')
+    parser_import.add_argument('--nodes', type=int, default=1000000)
+    parser_import.add_argument('--multipv', type=int, default=12)
+    parser_import.add_argument('--plies', type=int, default=30,
+                               help='Plies of each PGN game to analyse')
+    parser_import.set_defaults(func=Import)
+    parser_show = commands.add_parser('show', help='Show a prepared position')
+    parser_show.add_argument('fen')
+    parser_show.set_defaults(func=Show)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import json
+import logging
+
+# Engine profiles are sets of lc0 command line flags (without the leading
+# dashes) applied on top of config.COMMAND_LINE. They are stored in a json
+# file as {"name": {"flag": "value", ...}, ...}.
+
+DEFAULT_PROFILE = 'default'
+
+# UCI option names that can't be derived from the command line flag.
+UCI_NAMES = {
+    'policy-softmax-temp': 'PolicyTemperature',
+    'move-overhead': 'MoveOverheadMs',
+    'nncache': 'NNCacheSize',
+    'syzygy-paths': 'SyzygyPath',
+    'show-wdl': 'UCI_ShowWDL',
+    'show-movesleft': 'UCI_ShowMovesLeft',
+    'weights': 'WeightsFile',
+    'backend-opts': 'BackendOptions',
+}
+
+
+def LoadProfiles(path):
+    profiles = {DEFAULT_PROFILE: {}}
+    try:
+        with open(path) as f:
+            profiles.update(json.load(f))
+    except FileNotFoundError:
+        logging.info("No profiles file at %s" % path)
+    return profiles
+
+
+def ParseFlags(command_line):
+    flags = {}
+    for arg in command_line:
+        if not arg.startswith('--'):
+            continue
+        (flag, eq, value) = arg[2:].partition('=')
+        flags[flag] = value if eq else True
+    return flags
+
+
+def ApplyProfile(command_line, profile):
+    res = [x for x in command_line if not x.startswith('--')]
+    flags = ParseFlags(command_line)
+    flags.update(profile)
+    for flag, value in flags.items():
+        if value is True:
+            res.append(f'--{flag}')
+        elif value is not False and value is not None:
+            res.append(f'--{flag}={value}')
+    return res
+
+
+# Returns {flag: new value} for all flags that differ, None when removed.
+def ChangedFlags(old_command_line, new_command_line):
+    old = ParseFlags(old_command_line)
+    new = ParseFlags(new_command_line)
+    res = {}
+    for flag in list(old) + list(new):
+        if str(old.get(flag)) != str(new.get(flag)):
+            res[flag] = new.get(flag)
+    return res
+
+
+def UciOptionName(options, flag):
+    if flag in UCI_NAMES:
+        return UCI_NAMES[flag] if UCI_NAMES[flag] in options else None
+    normalized = flag.replace('-', '').lower()
+    for name in options:
+        if name.lower() == normalized:
+            return name
+    return None
+
+
+# Splits changed flags into UCI options that can be set on the running engine
+# and flags that need an engine restart.
+def PlanSwitch(options, changed):
+    uci = {}
+    restart = []
+    for flag, value in changed.items():
+        name = UciOptionName(options, flag)
+        if name is None:
+            restart.append(flag)
+        elif value is None:
+            default = options[name].default
+            uci[name] = default if default is not None else ''
+        else:
+            uci[name] = value
+    return (uci, restart)
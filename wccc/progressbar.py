@@ -3,6 +3,21 @@ import logging
 
 BLOCK_UNICODE = ' ▏▎▍▌▋▊▉█'
 TICK_UNICODE = '▏🭰🭱🭲🭳🭴🭵▕'
+VBLOCK_UNICODE = ' ▁▂▃▄▅▆▇█'
+BLOCK_ASCII = ' .:-=+*#@'
+TICK_ASCII = '||||||||'
+
+BLOCKS = BLOCK_UNICODE
+TICKS = TICK_UNICODE
+VBLOCKS = VBLOCK_UNICODE
+
+
+def UseAscii(enabled):
+    global BLOCKS, TICKS, VBLOCKS
+    BLOCKS = BLOCK_ASCII if enabled else BLOCK_UNICODE
+    TICKS = TICK_ASCII if enabled else TICK_UNICODE
+    VBLOCKS = BLOCK_ASCII if enabled else VBLOCK_UNICODE
+
 
 def TickBar(win, width, percentage, color1, color2):
     if not (0 <= percentage <1):
@@ -10,7 +25,7 @@ def TickBar(win, width, percentage, color1, color2):
     value_bits = int(8*width*percentage)
     left_width = value_bits // 8
     right_width = width - left_width - 1
-    res = ' ' * left_width + TICK_UNICODE[value_bits % 8] + ' ' * right_width
+    res = ' ' * left_width + TICKS[value_bits % 8] + ' ' * right_width
     win.addstr(res[:len(res)//2], curses.color_pair(color1))
     win.addstr(res[len(res)//2:], curses.color_pair(color2))
 
@@ -25,7 +40,7 @@ def ProgressBar(win, width, value, max_value, text, bar_color, remainder_color,
         win.addstr(' ' * left_width, curses.color_pair(bar_color))
     remainer_width = value_bits % 8
     if left_width < width:
-        win.addstr(BLOCK_UNICODE[remainer_width],
+        win.addstr(BLOCKS[remainer_width],
                    curses.color_pair(remainder_color))
     right_width = width - left_width - 1  # -1 for remainder
     if left_width >= len(text):
@@ -108,12 +123,38 @@ def WdlBar(win, width, w, d, l, white_bar, draw_bar, black_bar, white_to_draw,
         draw_meat(lw, white_width, white_bar)
         if white_bits % 8 > 0:
             win.addstr(
-                BLOCK_UNICODE[white_bits % 8],
+                BLOCKS[white_bits % 8],
                 curses.color_pair(
                     white_to_draw if draw_bits > 0 else white_to_black))
         draw_meat(ld, draw_width, draw_bar)
         if draw_bits and (white_bits + draw_bits) % 8 > 0:
-            win.addstr(BLOCK_UNICODE[(white_bits + draw_bits) % 8],
+            win.addstr(BLOCKS[(white_bits + draw_bits) % 8],
                        curses.color_pair(draw_to_black))
         draw_meat(lb, black_width, black_bar)
         return
+
+
+# One column of a vertical W/D/L bar, white at the bottom, from row down to
+# row + height - 1. colors are the white, draw and black blocks, then the
+# white to draw, white to black and draw to black transitions.
+def WdlColumn(win, row, col, height, w, d, l, colors):
+    total = w + d + l
+    white_bits = round(8 * height * w / total)
+    black_bits = round(8 * height * l / total)
+    draw_top = 8 * height - black_bits
+
+    def band(level):
+        if level < white_bits:
+            return 0
+        return 1 if level < draw_top else 2
+
+    for i in range(height):
+        bottom = 8 * (height - 1 - i)
+        lower = band(bottom)
+        upper = band(bottom + 7)
+        if lower == upper:
+            win.addstr(row + i, col, ' ', curses.color_pair(colors[lower]))
+            continue
+        lower_bits = sum(band(bottom + x) == lower for x in range(8))
+        win.addstr(row + i, col, VBLOCKS[lower_bits],
+                   curses.color_pair(colors[lower + upper + 2]))
@@ -0,0 +1,115 @@
+import curses
+import fcntl
+import logging
+import os
+import select
+import signal
+import termios
+import threading
+import time
+import tty
+
+# Relays the terminal through a pseudo-terminal so that everything curses
+# writes can be counted (and optionally throttled to simulate a slow SSH
+# link). Only used in remote mode.
+
+
+class TerminalRelay:
+
+    def __init__(self, max_bps=None):
+        self.max_bps = max_bps
+        self.bytes_written = 0
+        self.bps = 0
+        self.running = False
+        self.thread = None
+
+    def Start(self):
+        if not (os.isatty(0) and os.isatty(1)):
+            logging.info("Not a terminal, terminal relay disabled")
+            return False
+        self.real_in = os.dup(0)
+        self.real_out = os.dup(1)
+        self.saved_attrs = termios.tcgetattr(self.real_in)
+        self.master, slave = os.openpty()
+        self.CopyWinsize()
+        tty.setraw(self.real_in)
+        os.dup2(slave, 0)
+        os.dup2(slave, 1)
+        os.close(slave)
+        # Installed before curses starts, so ncurses keeps our handler.
+        signal.signal(signal.SIGWINCH, self.OnWinch)
+        self.running = True
+        self.thread = threading.Thread(target=self.Loop,
+                                       name='terminal-relay',
+                                       daemon=True)
+        self.thread.start()
+        logging.info("Terminal relay started, max_bps=%s" % self.max_bps)
+        return True
+
+    def Stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.thread.join()
+        self.Drain()
+        os.dup2(self.real_in, 0)
+        os.dup2(self.real_out, 1)
+        termios.tcsetattr(self.real_in, termios.TCSADRAIN, self.saved_attrs)
+        signal.signal(signal.SIGWINCH, signal.SIG_DFL)
+        for fd in [self.master, self.real_in, self.real_out]:
+            os.close(fd)
+        logging.info("Terminal relay stopped, %d bytes written" %
+                     self.bytes_written)
+
+    def CopyWinsize(self):
+        size = fcntl.ioctl(self.real_out, termios.TIOCGWINSZ, b'\0' * 8)
+        fcntl.ioctl(self.master, termios.TIOCSWINSZ, size)
+
+    def OnWinch(self, signum, frame):
+        self.CopyWinsize()
+        if not curses.isendwin():
+            (rows, cols) = os.get_terminal_size(1)
+            curses.resizeterm(rows, cols)
+            curses.ungetch(curses.KEY_RESIZE)
+
+    def Write(self, data):
+        os.write(self.real_out, data)
+        self.bytes_written += len(data)
+        if self.max_bps:
+            time.sleep(len(data) / self.max_bps)
+
+    def Drain(self):
+        while select.select([self.master], [], [], 0.05)[0]:
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                return
+            if not data:
+                return
+            self.Write(data)
+
+    def Loop(self):
+        chunk = 4096
+        if self.max_bps:
+            # Keep chunks small so that throttling adds latency gradually.
+            chunk = max(16, min(chunk, self.max_bps // 50))
+        window_start = time.monotonic()
+        window_bytes = self.bytes_written
+        while self.running:
+            (ready, _, _) = select.select([self.master, self.real_in], [], [],
+                                          0.1)
+            if self.master in ready:
+                self.Write(os.read(self.master, chunk))
+            if self.real_in in ready:
+                data = os.read(self.real_in, 1024)
+                if b'\x03' in data:
+                    # The pty is not our controlling terminal, so the line
+                    # discipline can't deliver SIGINT itself.
+                    os.kill(os.getpid(), signal.SIGINT)
+                os.write(self.master, data)
+            now = time.monotonic()
+            if now - window_start >= 1.0:
+                self.bps = (self.bytes_written - window_bytes) / (now -
+                                                                  window_start)
+                window_start = now
+                window_bytes = self.bytes_written
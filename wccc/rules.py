@@ -0,0 +1,35 @@
+import chess
+import chess.polyglot
+
+# Game termination as shown in the Status pane and adjudicated by the match
+# runner. Returns (result, label): result is None while the game goes on or
+# when the draw can only be claimed, label is None when nothing applies.
+
+
+def Termination(board):
+    if board.is_checkmate():
+        return ('0-1' if board.turn == chess.WHITE else '1-0', 'CHECKMATE')
+    if board.is_stalemate():
+        return ('1/2-1/2', 'DRAW: STALEMATE')
+    if board.is_insufficient_material():
+        return ('1/2-1/2', 'DRAW: NO MATERIAL')
+    if board.is_fifty_moves():
+        return ('1/2-1/2', 'DRAW: FIFTY MOVES')
+    if board.is_repetition(3):
+        return ('1/2-1/2', 'DRAW: THREEFOLD REPETITION')
+    if board.can_claim_fifty_moves():
+        return (None, 'DRAW POSSIBLE: FIFTY MOVES')
+    if board.can_claim_threefold_repetition():
+        return (None, 'DRAW POSSIBLE: THREEFOLD REP')
+    return (None, None)
+
+
+# Zobrist hash of the position after the first plies of board's game. Only the
+# moves after them are copied and undone, so it's cheap near the end.
+def HashAt(board, plies):
+    after = len(board.move_stack) - plies
+    if after:
+        board = board.copy(stack=after)
+        for _ in range(after):
+            board.pop()
+    return chess.polyglot.zobrist_hash(board)
@@ -0,0 +1,105 @@
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+
+# Sampling profiler that can be started in the middle of a game (Shift+F or
+# SIGUSR1). A background thread records the stacks of all other threads
+# every interval for a few seconds, then writes collapsed stacks (for
+# flamegraph.pl or speedscope) and a text summary. Nothing is paused; the
+# cost is the sampling thread holding the GIL briefly per sample.
+
+# Top functions listed in the summary.
+SUMMARY_LINES = 25
+
+
+def FrameName(frame):
+    code = frame.f_code
+    return "%s (%s:%d)" % (code.co_name, os.path.basename(
+        code.co_filename), code.co_firstlineno)
+
+
+class Sampler:
+
+    def __init__(self, logs_dir, interval):
+        self.logs_dir = logs_dir
+        self.interval = interval
+        self.thread = None
+
+    def Running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    # on_done is called from the sampling thread with a message.
+    def Start(self, seconds, on_done=None):
+        if self.Running():
+            logging.info("Profiler already running")
+            return False
+        logging.info("Profiling all threads for %.1fs" % seconds)
+        self.thread = threading.Thread(target=self.Run,
+                                       args=(seconds, on_done),
+                                       name='sampler',
+                                       daemon=True)
+        self.thread.start()
+        return True
+
+    def Run(self, seconds, on_done):
+        me = threading.get_ident()
+        stacks = collections.Counter()
+        names = {}
+        samples = 0
+        start = time.monotonic()
+        names_time = 0
+        while time.monotonic() - start < seconds:
+            now = time.monotonic()
+            if now - names_time > 1:
+                names = {x.ident: x.name for x in threading.enumerate()}
+                names_time = now
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(FrameName(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                stacks[';'.join(reversed(stack))] += 1
+            samples += 1
+            time.sleep(self.interval)
+        elapsed = time.monotonic() - start
+        path = self.Save(stacks, samples, elapsed)
+        message = "Profile: %d samples in %s" % (samples, path)
+        logging.info(message)
+        if on_done:
+            on_done(message)
+
+    def Save(self, stacks, samples, elapsed):
+        base = os.path.join(self.logs_dir,
+                            time.strftime('profile-%Y%m%d-%H%M%S'))
+        with open(base + '.collapsed', 'w') as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+        threads = collections.Counter()
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')
+            threads[frames[0]] += count
+            own[frames[-1]] += count
+            for name in set(frames[1:]):
+                total[name] += count
+        # Each sample counts once per thread.
+        thread_samples = max(1, sum(stacks.values()))
+        with open(base + '.txt', 'w') as f:
+            f.write(f"{samples} samples in {elapsed:.1f}s, "
+                    f"{samples / elapsed:.0f}/s\n\nThreads:\n")
+            for name, count in threads.most_common():
+                f.write(f"{count:8} {name}\n")
+            for title, counter in [("Self", own), ("Total", total)]:
+                f.write(f"\n{title}:\n")
+                for name, count in counter.most_common(SUMMARY_LINES):
+                    f.write(f"{count:8} {100 * count / thread_samples:5.1f}% "
+                            f"{name}\n")
+        return base + '.txt'
@@ -0,0 +1,72 @@
+import time
+from . import config
+
+# Longest time the main loop blocks waiting for a key, so engine output and
+# bestmove are still picked up promptly.
+POLL_INTERVAL = 0.01
+
+
+def IsLowTime(state):
+    # Our side is the one at the bottom of the board.
+    idx = 1 if state['flipped'] else 0
+    return state['timerenabled'] and state['timer'][idx] < config.LOW_TIME
+
+
+class RenderScheduler:
+
+    def __init__(self, state, max_fps=None):
+        self.state = state
+        self.max_fps = max_fps
+        self.rate = config.FRAME_RATE_IDLE
+        self.pending = True
+        self.urgent = True
+        self.last_frame = 0
+        self.skipped = 0
+        self.window_start = time.monotonic()
+        self.window_skipped = 0
+
+    # Something visible changed; drawn at the current rate.
+    def Invalidate(self):
+        if self.pending:
+            self.skipped += 1
+        self.pending = True
+
+    # Drawn on the next loop iteration, regardless of the rate.
+    def Urgent(self):
+        self.pending = True
+        self.urgent = True
+
+    def ChooseRate(self, searching):
+        if IsLowTime(self.state):
+            rate = config.FRAME_RATE_LOW_TIME
+        elif searching and self.pending:
+            rate = config.FRAME_RATE_SEARCH
+        else:
+            # Clocks and animations still need an occasional frame.
+            rate = config.FRAME_RATE_IDLE
+        if self.max_fps:
+            rate = min(rate, self.max_fps)
+        return rate
+
+    def TimeToFrame(self):
+        if self.urgent:
+            return 0
+        return max(0, self.last_frame + 1.0 / self.rate - time.monotonic())
+
+    def WaitTime(self):
+        return min(POLL_INTERVAL, self.TimeToFrame())
+
+    def FrameDue(self, searching):
+        self.rate = self.ChooseRate(searching)
+        now = time.monotonic()
+        if now - self.window_start >= 1.0:
+            self.state['framesskipped'] = self.skipped - self.window_skipped
+            self.window_skipped = self.skipped
+            self.window_start = now
+        self.state['framerate'] = self.rate
+        return self.TimeToFrame() <= 0
+
+    def FrameDrawn(self):
+        self.last_frame = time.monotonic()
+        self.pending = False
+        self.urgent = False
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# Every search info with a PV, kept for post-game analysis in one file per
+# column of fixed size values, appended across sessions. Rows are buffered by
+# the UI loop and written by a background thread; the reader memory-maps the
+# columns, so filtering a tournament's worth of infos doesn't parse anything.
+# A write cut short leaves columns of different lengths, so the writer first
+# truncates them all to the rows they have in full.
+#
+#   python3 -m wccc.searchlog data/searchlog summary
+#   python3 -m wccc.searchlog data/searchlog split SEARCH [--moves=5]
+
+import argparse
+import array
+import collections
+import mmap
+import os
+import queue
+import threading
+import time
+from .movecodec import EncodeMove, DecodeMove
+
+# (name, array typecode)
+COLUMNS = [
+    ('time', 'd'),  # Unix time the info arrived.
+    ('search', 'I'),
+    ('game', 'B'),
+    ('ply', 'H'),
+    ('multipv', 'B'),
+    ('move', 'H'),
+    ('nodes', 'Q'),
+    ('w', 'H'),
+    ('d', 'H'),
+    ('l', 'H'),
+    ('score', 'i'),  # Centipawns, white's point of view.
+]
+NO_SCORE = -2**31
+MATE_SCORE = 32000
+# Rows buffered before they're handed to the writer thread.
+BATCH_ROWS = 256
+
+
+def ColumnPath(path, name):
+    return os.path.join(path, name + '.col')
+
+
+# Truncates the columns to the rows written in all of them.
+def Recover(path):
+    sizes = {}
+    for name, typecode in COLUMNS:
+        try:
+            sizes[name] = os.path.getsize(ColumnPath(path, name))
+        except FileNotFoundError:
+            sizes[name] = 0
+    rows = min(sizes[name] // array.array(typecode).itemsize
+               for name, typecode in COLUMNS)
+    for name, typecode in COLUMNS:
+        size = rows * array.array(typecode).itemsize
+        if sizes[name] != size:
+            with open(ColumnPath(path, name), 'ab') as f:
+                f.truncate(size)
+    return rows
+
+
+class SearchLogWriter:
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        Recover(path)
+        self.rows = []
+        self.queue = queue.Queue()
+        # Incremented when the first search starts.
+        self.search = SearchLog(path).NextSearch() - 1
+        self.thread = threading.Thread(target=self.Loop,
+                                       name='searchlog',
+                                       daemon=True)
+        self.thread.start()
+
+    def StartSearch(self):
+        self.Flush()
+        self.search += 1
+
+    def Add(self, game, board, info):
+        score = NO_SCORE
+        if 'score' in info:
+            score = info['score'].white().score(mate_score=MATE_SCORE)
+        (w, d, l) = (0, 0, 0)
+        if 'wdl' in info:
+            wdl = info['wdl'].white()
+            (w, d, l) = (wdl.wins, wdl.draws, wdl.losses)
+        self.rows.append(
+            (time.time(), self.search, game, len(board.move_stack),
+             info.get('multipv', 1), EncodeMove(info['pv'][0]),
+             info.get('nodes', 0), w, d, l, score))
+        if len(self.rows) >= BATCH_ROWS:
+            self.Flush()
+
+    def Flush(self):
+        if self.rows:
+            self.queue.put(self.rows)
+            self.rows = []
+
+    # Writes the buffered rows and waits for the writer thread to finish.
+    def Close(self):
+        self.Flush()
+        self.queue.put(None)
+        self.thread.join()
+
+    def Loop(self):
+        files = [open(ColumnPath(self.path, x), 'ab') for x, _ in COLUMNS]
+        while True:
+            rows = self.queue.get()
+            if rows is None:
+                break
+            for i, (_, typecode) in enumerate(COLUMNS):
+                array.array(typecode, (x[i] for x in rows)).tofile(files[i])
+            for f in files:
+                f.flush()
+        for f in files:
+            f.close()
+
+
+class SearchLog:
+
+    def __init__(self, path):
+        self.columns = {}
+        sizes = []
+        for name, typecode in COLUMNS:
+            column = memoryview(b'').cast(typecode)
+            try:
+                with open(ColumnPath(path, name), 'rb') as f:
+                    if os.fstat(f.fileno()).st_size:
+                        data = mmap.mmap(f.fileno(),
+                                         0,
+                                         access=mmap.ACCESS_READ)
+                        size = len(data) // column.itemsize * column.itemsize
+                        column = memoryview(data)[:size].cast(typecode)
+            except FileNotFoundError:
+                pass
+            self.columns[name] = column
+            sizes.append(len(column))
+        # A column may be ahead of the others if a write was cut short.
+        self.rows = min(sizes)
+
+    def Column(self, name):
+        return self.columns[name][:self.rows]
+
+    def NextSearch(self):
+        return self.Column('search')[-1] + 1 if self.rows else 0
+
+    # Row indices of each search, in order.
+    def Searches(self):
+        res = collections.OrderedDict()
+        for i, search in enumerate(self.Column('search')):
+            res.setdefault(search, []).append(i)
+        return res
+
+    def Row(self, i):
+        return {name: self.columns[name][i] for name, _ in COLUMNS}
+
+
+def Summary(log, args):
+    times = log.Column('time')
+    nodes = log.Column('nodes')
+    multipv = log.Column('multipv')
+    moves = log.Column('move')
+    plies = log.Column('ply')
+    games = log.Column('game')
+    for search, rows in log.Searches().items():
+        best = [i for i in rows if multipv[i] == 1]
+        if not best:
+            continue
+        (first, last) = (best[0], best[-1])
+        # When the final best move last took over as best.
+        stable = None
+        for i in best:
+            if moves[i] != moves[last]:
+                stable = None
+            elif stable is None:
+                stable = i
+        print(f"search {search:5} board {games[first] + 1} "
+              f"ply {plies[first]:3} infos {len(rows):6} "
+              f"time {times[last] - times[first]:7.1f}s "
+              f"nodes {nodes[last]:11} "
+              f"best {DecodeMove(moves[last]).uci():5} "
+              f"stable after {times[stable] - times[first]:6.1f}s")
+
+
+def Split(log, args):
+    rows = log.Searches().get(args.search, [])
+    times = log.Column('time')
+    nodes = log.Column('nodes')
+    moves = log.Column('move')
+    if not rows:
+        print("No such search")
+        return
+    start = times[rows[0]]
+    split = {}
+    last_print = None
+    for i in rows:
+        split[moves[i]] = nodes[i]
+        if last_print is None or times[i] - last_print >= args.interval:
+            last_print = times[i]
+            top = sorted(split.items(), key=lambda x: -x[1])[:args.moves]
+            print(f"{times[i] - start:7.1f}s " + ' '.join(
+                f"{DecodeMove(m).uci()}={n}" for m, n in top))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search telemetry log.')
+    parser.add_argument('path')
+    commands = parser.add_subparsers(dest='command', required=True)
+    parser_summary = commands.add_parser('summary', help='One line per search')
+    parser_summary.set_defaults(func=Summary)
+    parser_split = commands.add_parser(
+        'split', help='How the node split of a search evolved')
+    parser_split.add_argument('search', type=int)
+    parser_split.add_argument('--moves', type=int, default=5)
+    parser_split.add_argument('--interval', type=float, default=1.0)
+    parser_split.set_defaults(func=Split)
+    args = parser.parse_args()
+    log = SearchLog(args.path)
+    args.func(log, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# Plays whole games against the stub engine in virtual time, to exercise the
+# clock handling (UpdateTimer, GetIncrement with drift_compensation, book
+# moves) without waiting for it. The controller runs with a VirtualClock:
+# the engine's moves take the time its search reports, the opponent's a
+# random thinking time, and nothing else moves the clock. After each game the
+# clocks are checked against the moves' times and increments, worked out
+# independently here.
+#
+# Games are split over processes, each with its own controller, stub engine
+# and data directory. A job keeps two cores busy, so by default there are
+# half as many jobs as cores.
+#
+#   ./main.py --simulate [--games=1000] [--jobs=8] [--book=e4.bin] [--seed=1]
+
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from . import config
+from .clock import VirtualClock
+from .scheduler import RenderScheduler
+
+# Games longer than this are adjudicated as drawn.
+MAX_PLIES = 400
+# Seconds by which a clock may differ from the expected one.
+TOLERANCE = 1e-6
+
+
+# Stands in for the TUI: the controller only invalidates frames and alerts.
+class HeadlessUi:
+
+    def __init__(self, state):
+        self.scheduler = RenderScheduler(state)
+
+    def SetState(self, state):
+        self.scheduler.state = state
+
+    def Alert(self):
+        pass
+
+
+# Increment the side to move gets, per the drift compensation described in
+# main.py, for the clock check.
+def ExpectedIncrement(state, engine_side):
+    if state['timedsearch'][0] == state['timedsearch'][1]:
+        return config.INCREMENT
+    if engine_side:
+        return max(0, config.INCREMENT - state['drift_compensation'])
+    return min(2 * config.INCREMENT,
+               config.INCREMENT + state['drift_compensation'])
+
+
+# Opponent's thinking time, spread around a share of its clock.
+def OpponentTime(rng, clock):
+    mean = max(0, clock) / 30 + config.INCREMENT * 0.8
+    return min(max(0, clock) * 0.5, rng.expovariate(1 / mean))
+
+
+def PlayGame(controller, clock, rng, engine_white):
+    state = controller.NewGame()
+    state['timedsearch'] = [engine_white, not engine_white]
+    state['drift_compensation'] = rng.uniform(0, config.INCREMENT)
+    state['engine'] = True
+    state['timerenabled'] = True
+    board = state['board']
+    expected = [config.START_TIME, config.START_TIME]
+    errors = []
+    last = clock.Monotonic()
+    plies = 0
+    flagged = None
+    started = time.monotonic()
+
+    while True:
+        # Books the moves played since the last check; plies after the
+        # first at the same time, like book moves, took no time.
+        while plies < len(board.move_stack):
+            side = plies % 2
+            expected[side] += ExpectedIncrement(
+                state, state['timedsearch'][side]) - (clock.Monotonic() - last)
+            last = clock.Monotonic()
+            if abs(state['timer'][side] - expected[side]) > TOLERANCE:
+                errors.append(f"ply {plies + 1}: clock {side} is "
+                              f"{state['timer'][side]:.6f}, expected "
+                              f"{expected[side]:.6f}")
+            if state['timer'][side] < 0:
+                flagged = side
+            plies += 1
+        if (flagged is not None or board.is_game_over()
+                or plies >= MAX_PLIES or errors):
+            break
+
+        controller.CheckStartup()
+        if not controller.ready:
+            time.sleep(0.01)
+            continue
+        if state['timedsearch'][0 if board.turn else 1]:
+            # Starts the search, or plays a book move.
+            controller.Step()
+            if len(board.move_stack) > plies or controller.search is None:
+                continue
+            controller.search.wait()
+            controller.UpdateSearchInfo()
+            used = state['thinking'].get('curr', {}).get('time', 0)
+            clock.Advance(
+                max(0, controller.search_started + used - clock.Monotonic()))
+            controller.UpdateTimer()
+            controller.Step()
+        else:
+            # The engine analyses while the opponent thinks.
+            controller.Step()
+            clock.Advance(
+                OpponentTime(rng, state['timer'][0 if board.turn else 1]))
+            controller.UpdateTimer()
+            state['nextmove'] = rng.choice(list(board.legal_moves)).uci()
+            state['commitmove'] = True
+            controller.Step()
+
+    if flagged is not None:
+        result = '0-1' if flagged == 0 else '1-0'
+    elif board.is_game_over():
+        result = board.result()
+    else:
+        result = '1/2-1/2'
+    return {
+        'result': result,
+        'engine_white': engine_white,
+        'engine_flagged': (flagged is not None
+                           and state['timedsearch'][flagged]),
+        'plies': plies,
+        'seconds': time.monotonic() - started,
+        'errors': errors,
+    }
+
+
+# Plays games in a process of its own.
+def RunJob(args):
+    (make_controller, games, seed, book) = args
+    logging.getLogger().setLevel(logging.WARNING)
+    data_dir = tempfile.mkdtemp(prefix='wccc-simulate-')
+    clock = VirtualClock()
+    controller = make_controller(data_dir, clock, book)
+    controller.tui = HeadlessUi(controller.state)
+    rng = random.Random(seed)
+    results = []
+    try:
+        for i in range(games):
+            start = clock.Monotonic()
+            res = PlayGame(controller, clock, rng, i % 2 == 0)
+            res['virtual'] = clock.Monotonic() - start
+            results.append(res)
+    finally:
+        controller.DiscardSearch()
+        if controller.engine:
+            controller.engine.quit()
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return results
+
+
+def Report(results, seconds):
+    score = 0
+    for res in results:
+        if res['result'] == '1/2-1/2':
+            score += 0.5
+        elif (res['result'] == '1-0') == res['engine_white']:
+            score += 1
+    errors = [x for x in results if x['errors']]
+    print(f"{len(results)} games in {seconds:.1f}s, "
+          f"{sum(x['seconds'] for x in results) / len(results) * 1000:.1f}ms "
+          f"each for {sum(x['virtual'] for x in results) / len(results):.0f}"
+          f" virtual seconds")
+    print(f"Engine score {score}/{len(results)}, plies "
+          f"{sum(x['plies'] for x in results) / len(results):.1f} on average")
+    print(f"Engine lost on time: "
+          f"{sum(1 for x in results if x['engine_flagged'])}")
+    print(f"Games with clock errors: {len(errors)}")
+    for res in errors[:10]:
+        print(f"  {res['result']} after {res['plies']} plies: "
+              f"{res['errors'][0]}")
+    return not errors
+
+
+def main(make_controller):
+    parser = argparse.ArgumentParser(
+        description='Simulated games in virtual time.')
+    parser.add_argument('--simulate', action='store_true')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--jobs', type=int,
+                        default=max(1, os.cpu_count() // 2))
+    parser.add_argument('--book', help='Opening book, as OPENING_BOOK')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    jobs = max(1, min(args.jobs, args.games))
+    tasks = [(make_controller, args.games // jobs +
+              (1 if i < args.games % jobs else 0), args.seed + i, args.book)
+             for i in range(jobs)]
+    with multiprocessing.Pool(jobs) as pool:
+        results = sum(pool.map(RunJob, tasks), [])
+    if not Report(results, time.monotonic() - start):
+        raise SystemExit(1)
@@ -0,0 +1,68 @@
+import collections
+
+# Estimates how sure it is that the best move of a timed search won't change
+# before the engine would play it, so the operator (or STABLE_AUTO_STOP) can
+# force it early and keep the clock for later.
+#
+# The second move has to gain lead nodes on the best one in the time left.
+# The rate it gained at over the last STABLE_WINDOW seconds, plus a swing of
+# STABLE_SWING of the nps it could still pick up, gives how much of the lead
+# it is expected to take; the confidence is the share of the lead left. If it
+# couldn't catch up even taking every node, the move is certain. A second
+# move that looks better by WDL lowers the confidence to 0 at a gap of
+# STABLE_WDL_MARGIN in expected score.
+
+
+# Of the side to move, from a WDL from white's point of view.
+def ExpectedScore(wdl, white):
+    if wdl is None or not wdl.total():
+        return None
+    return wdl.expectation() if white else 1 - wdl.expectation()
+
+
+class StabilityDetector:
+
+    def __init__(self, window, swing, wdl_margin):
+        self.window = window
+        self.swing = swing
+        self.wdl_margin = wdl_margin
+        self.Reset()
+
+    def Reset(self):
+        self.best = None
+        # (time, best nodes, second nodes) while the best move stayed.
+        self.samples = collections.deque()
+
+    # Confidence in [0, 1] that the best move stays, None until there's a
+    # trend to go on. elapsed and budget are the seconds searched and those
+    # the engine is expected to use on this move.
+    def Feed(self, moves, white, elapsed, budget, nps):
+        if len(moves) < 2:
+            return None
+        ((best, b), (_, s)) = sorted(moves.items(),
+                                     key=lambda x: (x[1]['nodes'], x[0]),
+                                     reverse=True)[:2]
+        if best != self.best:
+            self.best = best
+            self.samples.clear()
+        self.samples.append((elapsed, b['nodes'], s['nodes']))
+        while (len(self.samples) > 2
+               and elapsed - self.samples[1][0] >= self.window):
+            self.samples.popleft()
+        (t0, b0, s0) = self.samples[0]
+        remaining = budget - elapsed
+        lead = b['nodes'] - s['nodes']
+        if elapsed - t0 < self.window / 2 or remaining <= 0 or nps <= 0:
+            return None
+        if lead <= 0:
+            return 0.0
+        if lead >= nps * remaining:
+            return 1.0
+        trend = ((s['nodes'] - s0) - (b['nodes'] - b0)) / (elapsed - t0)
+        gain = (max(0, trend) + self.swing * nps) * remaining
+        confidence = max(0.0, 1 - gain / lead)
+        b_score = ExpectedScore(b.get('wdl'), white)
+        s_score = ExpectedScore(s.get('wdl'), white)
+        if b_score is not None and s_score is not None and s_score > b_score:
+            confidence *= max(0.0, 1 - (s_score - b_score) / self.wdl_margin)
+        return confidence
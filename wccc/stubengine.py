@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# Fake UCI engine for exercising the TUI without lc0 and GPUs. It plays random
+# legal moves and reports made-up search info at a configurable NPS, with the
+# same info fields lc0 sends (including wdl and multipv).
+#
+# With --virtual, time is only counted: timed searches report the time they
+# would have taken and return at once, infinite ones wait for stop. Used by
+# simulated games (wccc/simulate.py).
+#
+#   python3 wccc/stubengine.py [--nps=N] [--info-interval=SECONDS] [--virtual]
+
+import random
+import sys
+import threading
+import time
+import chess
+
+
+class StubEngine:
+
+    def __init__(self, nps, info_interval, virtual=False):
+        self.nps = nps
+        self.info_interval = info_interval
+        self.virtual = virtual
+        self.board = chess.Board()
+        self.multipv = 1
+        self.search = None
+        self.stop = threading.Event()
+        self.out_lock = threading.Lock()
+
+    def Send(self, line):
+        with self.out_lock:
+            sys.stdout.write(line + '\n')
+            sys.stdout.flush()
+
+    def Position(self, args):
+        if args[0] == 'startpos':
+            self.board = chess.Board()
+            args = args[1:]
+        elif args[0] == 'fen':
+            self.board = chess.Board(' '.join(args[1:7]))
+            args = args[7:]
+        if args and args[0] == 'moves':
+            for move in args[1:]:
+                self.board.push_uci(move)
+
+    # Roughly what a time manager would spend on this move.
+    def Budget(self, params):
+        if 'infinite' in params:
+            return None
+        if 'movetime' in params:
+            return params['movetime'] / 1000
+        if 'nodes' in params:
+            return params['nodes'] / self.nps
+        side = 'w' if self.board.turn else 'b'
+        remaining = params.get(side + 'time', 60000) / 1000
+        inc = params.get(side + 'inc', 0) / 1000
+        return max(0.01, min(remaining / 2, remaining / 25 + inc * 0.8))
+
+    def Go(self, args):
+        params = {}
+        i = 0
+        while i < len(args):
+            if args[i] == 'infinite':
+                params['infinite'] = True
+                i += 1
+            else:
+                params[args[i]] = int(args[i + 1])
+                i += 2
+        self.stop.clear()
+        self.search = threading.Thread(target=self.Search,
+                                       args=(self.Budget(params), ),
+                                       daemon=True)
+        self.search.start()
+
+    def Search(self, budget):
+        moves = list(self.board.legal_moves)
+        if not moves:
+            self.Send('bestmove 0000')
+            return
+        random.shuffle(moves)
+        weights = [random.random()**3 for _ in moves]
+        total = sum(weights)
+        order = sorted(range(len(moves)), key=lambda x: -weights[x])
+        # Only the reported moves get a PV, a reply picked once.
+        pvs = {}
+        for idx in order[:self.multipv]:
+            self.board.push(moves[idx])
+            replies = list(self.board.legal_moves)
+            pv = [moves[idx]] + ([random.choice(replies)] if replies else [])
+            pvs[idx] = ' '.join(x.uci() for x in pv)
+            self.board.pop()
+        start = time.monotonic()
+        elapsed = 0
+        while True:
+            if not self.virtual:
+                elapsed = time.monotonic() - start
+            done = budget is not None and elapsed >= budget
+            wait = 0 if done else min(
+                self.info_interval,
+                budget - elapsed if budget is not None else self.info_interval)
+            if not self.virtual:
+                done = self.stop.wait(wait) or done
+                elapsed = time.monotonic() - start
+            elif budget is None:
+                done = self.stop.wait()
+            else:
+                elapsed += wait
+                done = self.stop.is_set() or elapsed >= budget
+            nodes = max(1, int(elapsed * self.nps))
+            for pv_idx, idx in enumerate(order[:self.multipv]):
+                share = weights[idx] / total
+                cp = int((weights[idx] - 0.5) * 100)
+                w = int(300 + cp)
+                l = int(300 - cp)
+                self.Send(
+                    f'info depth {5 + int(elapsed)} seldepth '
+                    f'{12 + int(elapsed)} time {int(elapsed * 1000)} nodes '
+                    f'{int(nodes * share)} score cp {cp} wdl {w} '
+                    f'{1000 - w - l} {l} nps {self.nps} multipv {pv_idx + 1} '
+                    f'pv {pvs[idx]}')
+            if done or self.stop.is_set():
+                break
+        self.Send(f'bestmove {moves[order[0]].uci()}')
+
+    def Run(self):
+        for line in sys.stdin:
+            tokens = line.split()
+            if not tokens:
+                continue
+            cmd = tokens[0]
+            if cmd == 'uci':
+                self.Send('id name StubEngine')
+                self.Send('id author wccc')
+                self.Send('option name MultiPV type spin default 1 min 1 '
+                          'max 500')
+                self.Send('uciok')
+            elif cmd == 'isready':
+                self.Send('readyok')
+            elif cmd == 'setoption':
+                if len(tokens) >= 5 and tokens[2].lower() == 'multipv':
+                    self.multipv = int(tokens[4])
+            elif cmd == 'position':
+                self.Position(tokens[1:])
+            elif cmd == 'go':
+                self.Go(tokens[1:])
+            elif cmd == 'stop':
+                self.stop.set()
+                if self.search:
+                    self.search.join()
+            elif cmd == 'quit':
+                self.stop.set()
+                return
+
+
+def main():
+    nps = 20000
+    info_interval = 0.1
+    virtual = False
+    for arg in sys.argv[1:]:
+        if arg.startswith('--nps='):
+            nps = int(arg.split('=', 1)[1])
+        elif arg.startswith('--info-interval='):
+            info_interval = float(arg.split('=', 1)[1])
+        elif arg == '--virtual':
+            virtual = True
+    StubEngine(nps, info_interval, virtual).Run()
+
+
+if __name__ == "__main__":
+    main()
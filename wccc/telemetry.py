@@ -0,0 +1,243 @@
+import http.server
+import logging
+import logging.handlers
+import os
+import statistics
+import threading
+import time
+
+# Search telemetry in Prometheus text format. The UI loop only updates the
+# in-memory metrics; rendering, the HTTP endpoint and the textfile writer all
+# run on their own threads.
+
+TIME_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1]
+MOVE_TIME_BUCKETS = [1, 2, 5, 10, 20, 30, 60, 120, 300]
+NPS_BUCKETS = [1e3, 1e4, 2e4, 5e4, 1e5, 2e5, 5e5, 1e6]
+NODES_BUCKETS = [1e4, 1e5, 3e5, 1e6, 3e6, 1e7, 3e7, 1e8]
+
+# Number of recent moves the NPS of a move is compared with.
+SLOWDOWN_WINDOW = 10
+
+
+def FormatValue(x):
+    if x == float('inf'):
+        return '+Inf'
+    return repr(float(x)) if isinstance(x, float) else str(x)
+
+
+class Metric:
+    TYPE = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+
+    def Render(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} '
+                f'{self.TYPE}'] + self.Samples()
+
+
+class Gauge(Metric):
+    TYPE = 'gauge'
+
+    def __init__(self, name, help):
+        super().__init__(name, help)
+        self.value = 0
+
+    def Set(self, value):
+        self.value = value
+
+    def Samples(self):
+        return [f'{self.name} {FormatValue(self.value)}']
+
+
+class Counter(Gauge):
+    TYPE = 'counter'
+
+    def Inc(self, value=1):
+        self.value += value
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name, help, buckets):
+        super().__init__(name, help)
+        self.buckets = list(buckets) + [float('inf')]
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0
+        self.count = 0
+
+    def Observe(self, value):
+        for i, le in enumerate(self.buckets):
+            if value <= le:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def Samples(self):
+        res = []
+        total = 0
+        for le, count in zip(self.buckets, self.counts):
+            total += count
+            res.append(f'{self.name}_bucket{{le="{FormatValue(le)}"}} {total}')
+        res.append(f'{self.name}_sum {FormatValue(self.sum)}')
+        res.append(f'{self.name}_count {self.count}')
+        return res
+
+
+class Telemetry:
+
+    def __init__(self, slowdown_ratio):
+        self.lock = threading.Lock()
+        self.metrics = []
+        self.slowdown_ratio = slowdown_ratio
+        self.move_nps_history = []
+        self.threads = []
+        self.server = None
+
+        self.nps = self.Add(
+            Gauge('wccc_nps', 'Latest nodes per second reported by the engine.'))
+        self.depth = self.Add(Gauge('wccc_depth', 'Latest search depth.'))
+        self.seldepth = self.Add(
+            Gauge('wccc_seldepth', 'Latest selective search depth.'))
+        self.infos = self.Add(
+            Counter('wccc_infos_total', 'Search infos received.'))
+        self.searches = self.Add(
+            Counter('wccc_searches_total', 'Searches started.'))
+        self.restarts_avoided = self.Add(
+            Counter('wccc_restarts_avoided_total',
+                    'Search restarts saved by coalescing position changes.'))
+        self.moves = self.Add(
+            Counter('wccc_engine_moves_total', 'Searches that ended in a move.'))
+        self.slowdowns = self.Add(
+            Counter('wccc_slowdowns_total',
+                    'Moves with NPS below the slowdown threshold.'))
+        self.move_nps = self.Add(
+            Histogram('wccc_move_nps', 'Average NPS per engine move.',
+                      NPS_BUCKETS))
+        self.move_nodes = self.Add(
+            Histogram('wccc_move_nodes', 'Nodes searched per engine move.',
+                      NODES_BUCKETS))
+        self.move_seconds = self.Add(
+            Histogram('wccc_move_seconds', 'Time used per engine move.',
+                      MOVE_TIME_BUCKETS))
+        self.queue_lag = self.Add(
+            Histogram(
+                'wccc_info_lag_seconds',
+                'Time between the engine reporting an info and the UI '
+                'loop processing it.', TIME_BUCKETS))
+        self.frame_seconds = self.Add(
+            Histogram('wccc_frame_seconds', 'Time to draw a frame.',
+                      TIME_BUCKETS))
+
+    def Add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def Render(self):
+        lines = []
+        with self.lock:
+            for metric in self.metrics:
+                lines += metric.Render()
+        return '\n'.join(lines) + '\n'
+
+    def OnInfo(self, info, lag):
+        with self.lock:
+            self.infos.Inc()
+            if 'nps' in info:
+                self.nps.Set(info['nps'])
+            if 'depth' in info:
+                self.depth.Set(info['depth'])
+            if 'seldepth' in info:
+                self.seldepth.Set(info['seldepth'])
+            if lag is not None:
+                self.queue_lag.Observe(max(0, lag))
+
+    def OnRestartsAvoided(self, count):
+        with self.lock:
+            self.restarts_avoided.Inc(count)
+
+    def OnSearchStarted(self):
+        with self.lock:
+            self.searches.Inc()
+
+    def OnFrame(self, seconds):
+        with self.lock:
+            self.frame_seconds.Observe(seconds)
+
+    # Returns an alert message if the move was searched noticeably slower
+    # than the recent ones.
+    def OnMove(self, nodes, seconds, nps):
+        alert = None
+        with self.lock:
+            self.moves.Inc()
+            self.move_nodes.Observe(nodes)
+            self.move_seconds.Observe(seconds)
+            self.move_nps.Observe(nps)
+            history = self.move_nps_history[-SLOWDOWN_WINDOW:]
+            if len(history) >= 3:
+                median = statistics.median(history)
+                if nps < median * self.slowdown_ratio:
+                    self.slowdowns.Inc()
+                    alert = "NPS %d is %d%% below median %d" % (
+                        nps, 100 - 100 * nps / median, median)
+            self.move_nps_history.append(nps)
+        if alert:
+            logging.warning("Slowdown: %s" % alert)
+        return alert
+
+    def StartHttp(self, port):
+        telemetry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = telemetry.Render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', port),
+                                                      Handler)
+        self.StartThread(self.server.serve_forever, 'telemetry-http')
+        logging.info(f"Serving telemetry on http://127.0.0.1:{port}/metrics")
+
+    # Writes the current metrics to path (atomically, as node_exporter's
+    # textfile collector expects) and appends them to a rotating history.
+    def StartTextfile(self, path, interval, max_bytes, backups):
+        history = logging.getLogger('wccc.telemetry')
+        history.propagate = False
+        handler = logging.handlers.RotatingFileHandler(path + '.history',
+                                                       maxBytes=max_bytes,
+                                                       backupCount=backups)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        history.addHandler(handler)
+
+        def Loop():
+            while True:
+                time.sleep(interval)
+                text = self.Render()
+                with open(path + '.tmp', 'w') as f:
+                    f.write(text)
+                os.replace(path + '.tmp', path)
+                history.info('# %s\n%s' % (time.strftime('%Y-%m-%dT%H:%M:%S'),
+                                           text))
+
+        self.StartThread(Loop, 'telemetry-textfile')
+        logging.info(f"Writing telemetry to {path}")
+
+    def StartThread(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self.threads.append(thread)
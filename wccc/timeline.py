@@ -0,0 +1,44 @@
+import contextlib
+import logging
+import threading
+import time
+
+# Records how long each startup phase took, and on which thread, so that a
+# slow restart in the middle of a game can be explained from the log.
+
+
+class Timeline:
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+        # (name, start, duration, thread), times relative to self.start.
+        self.phases = []
+
+    def Add(self, name, begin, end):
+        with self.lock:
+            self.phases.append((name, begin - self.start, end - begin,
+                                threading.current_thread().name))
+
+    @contextlib.contextmanager
+    def Phase(self, name):
+        begin = time.monotonic()
+        try:
+            yield
+        finally:
+            self.Add(name, begin, time.monotonic())
+
+    def Mark(self, name):
+        now = time.monotonic()
+        self.Add(name, now, now)
+
+    def Log(self):
+        with self.lock:
+            phases = sorted(self.phases, key=lambda x: x[1])
+        logging.info("Startup timeline:")
+        for name, begin, duration, thread in phases:
+            logging.info(f"  {begin:7.3f}s +{duration:7.3f}s {name:12} "
+                         f"({thread})")
+        if phases:
+            logging.info("Startup took %.3fs" %
+                         max(x[1] + x[2] for x in phases))
@@ -1,9 +1,13 @@
 import curses
 import logging
 import chess
+import chess.polyglot
 import datetime
 from . import progressbar
+from . import rules
 from . import config
+from .movecodec import EncodeMove, DecodeMove
+from .scheduler import RenderScheduler
 
 #PIECES_UNICODE = '♙♘♗♖♕♔'
 #PIECES_UNICODE = '♟♞♝♜♛♚'
@@ -85,6 +89,11 @@ PIECES = [
     ['♙ P', '♘ N', '♗ B', '♖ R', '♕ Q', '♔ K'],
     ['pawn', 'kNight', 'Bishop', 'ROOK', 'QUEEN', 'KING'],
 ]
+# Piece sets above that are plain ASCII, the only ones cycled in ASCII mode.
+ASCII_PIECES = [2, 4]
+
+BOX_UNICODE = '┌┐│└┘╱╲'
+BOX_ASCII = '++|++/\\'
 
 # Change thouse to 0..15 if youo have 16-color palette
 BLACK_PIECES = 232  # 0
@@ -101,6 +110,8 @@ WHITE_BG = 231
 BLACK_TEXT = 0
 WHITE_TEXT = 231
 
+ASCII = config.REMOTE_MODE and config.REMOTE_ASCII
+
 # Colors:q
 # Default = 0
 # WhiteOnDark = 1
@@ -171,12 +182,12 @@ class Background(Widget):
 class HelpPane(Widget):
 
     def __init__(self, parent, state):
-        super().__init__(parent, state, 10, 31, 34, 1)
+        super().__init__(parent, state, 8, 31, 34, 1)
 
     def Draw(self):
         self.win.addstr(
             0, 0, "(Shift+1) force\n(Shift+U) undo\n"
-            "    (Tab) flip\n(Shift+V) view\n\n")
+            "    (Tab) flip\n(Shift+V) view\n(Shift+I) what if")
         self.win.addstr("\n Autocommit (Shift+A): ")
         if self.state['autocommitenabled']:
             self.win.addstr("[ ON  ]", curses.color_pair(7))
@@ -187,6 +198,12 @@ class HelpPane(Widget):
             self.win.addstr("[ ON  ]", curses.color_pair(6))
         else:
             self.win.addstr("[ OFF ]", curses.color_pair(7))
+        self.win.addstr("\n Move stats (Shift+S): ")
+        if self.state['movestats']:
+            self.win.addstr("[ ON  ]", curses.color_pair(7))
+        else:
+            self.win.addstr("[ OFF ]", curses.color_pair(0))
+        self.win.clrtoeol()
 
         super().Draw()
 
@@ -196,15 +213,44 @@ class HelpPane(Widget):
                 'autocommitenabled'] = not self.state['autocommitenabled']
         elif key == ord('M'):  # Shift+M
             self.state['movenotify'] = not self.state['movenotify']
+        elif key == ord('S'):  # Shift+S
+            self.state['movestats'] = not self.state['movestats']
+        elif key == ord('W'):  # Shift+W
+            # Arms the typed move, or the engine's predicted reply.
+            if self.state['premove']:
+                self.state['premove'] = ''
+            elif len(self.state['nextmove']) >= 4:
+                self.state['premove'] = self.state['nextmove']
+                self.state['nextmove'] = ''
+            else:
+                self.state['premove'] = '*'
+        elif key == ord('F'):  # Shift+F
+            self.state['startprofile'] = True
+        elif key == ord('I'):  # Shift+I
+            # Queues the typed move as a what-if line, or cycles through the
+            # lines and back to the main search.
+            if len(self.state['nextmove']) >= 4:
+                self.state['whatifadd'] = self.state['nextmove']
+                self.state['nextmove'] = ''
+            else:
+                self.state['whatifview'] = (self.state['whatifview'] + 1) % (
+                    len(self.state['whatif']) + 1)
         elif key == ord('V'):  # Shift+V
-            self.state['piecedisplay'] += 1
-            if self.state['piecedisplay'] >= len(PIECES):
-                self.state['piecedisplay'] = 0
+            displays = PieceDisplays()
+            if self.state['piecedisplay'] in displays:
+                idx = displays.index(self.state['piecedisplay']) + 1
+            else:
+                idx = 0
+            self.state['piecedisplay'] = displays[idx % len(displays)]
         else:
             return False
         return True
 
 
+def PieceDisplays():
+    return ASCII_PIECES if ASCII else list(range(len(PIECES)))
+
+
 def GetStrobe(val, on, off, offset):
     val += on+off - offset
     val %= on+off
@@ -230,6 +276,8 @@ class ChessBoard(Widget):
                 ]
             ]
 
+        box = BOX_ASCII if ASCII else BOX_UNICODE
+
         def DrawCell(cell):
             square = chess.parse_square(cell)
             rank_idx = ord(cell[0]) - ord('a')
@@ -278,14 +326,14 @@ class ChessBoard(Widget):
 
             if cell in lastmove:
                 hor = '+' + '-' * (self.CELL_WIDTH - 2) + '+'
-                self.win.addstr(row + 0, col, '┌', curses.color_pair(11))
-                self.win.addstr(row + 0, col + self.CELL_WIDTH - 1, '┐',
+                self.win.addstr(row + 0, col, box[0], curses.color_pair(11))
+                self.win.addstr(row + 0, col + self.CELL_WIDTH - 1, box[1],
                                 curses.color_pair(11))
-                self.win.addstr(row + 1, col, '│', curses.color_pair(11))
-                self.win.addstr(row + 1, col + self.CELL_WIDTH - 1, '│',
+                self.win.addstr(row + 1, col, box[2], curses.color_pair(11))
+                self.win.addstr(row + 1, col + self.CELL_WIDTH - 1, box[2],
                                 curses.color_pair(11))
-                self.win.addstr(row + 2, col, '└', curses.color_pair(11))
-                self.win.addstr(row + 2, col + self.CELL_WIDTH - 1, '┘',
+                self.win.addstr(row + 2, col, box[3], curses.color_pair(11))
+                self.win.addstr(row + 2, col + self.CELL_WIDTH - 1, box[4],
                                 curses.color_pair(11))
 
             if cell in [
@@ -293,14 +341,14 @@ class ChessBoard(Widget):
                     self.state['nextmove'][2:4],
             ]:
                 hor = '-' * (self.CELL_WIDTH - 2)
-                self.win.addstr(row + 0, col + 1, '╱', curses.color_pair(10))
-                self.win.addstr(row + 0, col + self.CELL_WIDTH - 2, '╲',
+                self.win.addstr(row + 0, col + 1, box[5], curses.color_pair(10))
+                self.win.addstr(row + 0, col + self.CELL_WIDTH - 2, box[6],
                                 curses.color_pair(10))
                 self.win.addstr(row + 1, col, '<', curses.color_pair(10))
                 self.win.addstr(row + 1, col + self.CELL_WIDTH - 1, '>',
                                 curses.color_pair(10))
-                self.win.addstr(row + 2, col + 1, '╲', curses.color_pair(10))
-                self.win.addstr(row + 2, col + self.CELL_WIDTH - 2, '╱',
+                self.win.addstr(row + 2, col + 1, box[6], curses.color_pair(10))
+                self.win.addstr(row + 2, col + self.CELL_WIDTH - 2, box[5],
                                 curses.color_pair(10))
 
         self.win.erase()
@@ -333,6 +381,13 @@ class ChessBoard(Widget):
         file = files[row if self.state['flipped'] else 7 - row]
         square = rank + file
 
+        # One click on the target square plays the premove.
+        premove = self.state['premove']
+        if (not self.state['nextmove'] and premove not in ['', '*']
+                and square == premove[2:4]):
+            self.state['playpremove'] = True
+            return True
+
         side_to_move = self.state['board'].turn
         idx = chess.SQUARE_NAMES.index(square)
         piece = self.state['board'].piece_at(idx)
@@ -375,19 +430,25 @@ class StatusBar(Widget):
         self.count += 1
         self.win.bkgdset(' ', curses.color_pair(5))
         status_msg = self.state['statusbar']
+        # The profiler's key is with the other diagnostics.
+        right = "(Shift+F) profile  FPS: %3d/%-3d skip: %-4d" % (
+            self.fps, self.state.get('framerate', 0),
+            self.state.get('framesskipped', 0))
+        if config.REMOTE_MODE:
+            right += " B/s: %-6s" % ShortenNum(self.state.get('termbps', 0), 5)
         self.win.addstr(
-            0, 0, f" %-{SCREEN_WIDTH-10}sFPS: %-5d" %
-            (status_msg, self.fps))
+            0, 0, f" %-{SCREEN_WIDTH-len(right)}s%s" % (status_msg, right))
         if not status_msg:
                pv = self.state['thinking'].get('curr', {}).get('pv', [])
                black = self.state['board'].turn == chess.BLACK
                total_sz = 3
                self.win.addstr(0, 0, "PV:", curses.color_pair(5))
                board = self.state['board'].copy()
+               max_sz = SCREEN_WIDTH - len(right) - 5
                for x in pv:
                     y = board.san(x)
                     board.push(x)
-                    if total_sz > SCREEN_WIDTH-15:
+                    if total_sz > max_sz:
                         break
                     self.win.addstr(' '+ y, curses.color_pair(5 if black else 22))
                     black = not black
@@ -433,6 +494,15 @@ class Engine(Widget):
         self.win.addstr(
             '[ timed  ]' if tim[1] else '[infinite]',
             curses.color_pair(7 if tim[1] == self.state['flipped'] else 6))
+        self.win.addstr(3, 0, "Profile (Shift+P): ")
+        selected = self.state['selectedprofile']
+        if selected != self.state['profile']:
+            self.win.addstr(f"{selected} (Ctrl+P) apply", curses.color_pair(6))
+        else:
+            self.win.addstr(selected, curses.color_pair(10))
+            self.win.addstr(
+                f" {self.state['profilestatus']}"[:45 - self.win.getyx()[1]])
+        self.win.clrtoeol()
         super().Draw()
 
     def OnKey(self, key):
@@ -444,6 +514,13 @@ class Engine(Widget):
             self.state['timedsearch'][0] = not self.state['timedsearch'][0]
         elif key == ord('x'):
             self.state['timedsearch'][1] = not self.state['timedsearch'][1]
+        elif key == ord('P'):
+            names = self.state['profilenames']
+            idx = (names.index(self.state['selectedprofile']) +
+                   1 if self.state['selectedprofile'] in names else 0)
+            self.state['selectedprofile'] = names[idx % len(names)]
+        elif key == 16:  # Ctrl+P
+            self.state['switchprofile'] = self.state['selectedprofile']
         else:
             return False
         return True
@@ -452,11 +529,11 @@ class Engine(Widget):
 class Promotions(Widget):
 
     def __init__(self, parent, state):
-        super().__init__(parent, state, 4, 39, 35, 18)
+        super().__init__(parent, state, 3, 40, 36, 18)
 
     def Draw(self):
         prom = self.state['promotion']
-        self.win.addstr(0, 0, "Promote to: ")
+        self.win.addstr(0, 0, "Promote to (or type q/r/b/n): ")
         self.win.addstr(1, 0, "[ Queen (Shift+Q) ]",
                         curses.color_pair(7 if prom == 'Q' else 0))
         self.win.addstr("[ Knight (Shift+N) ]",
@@ -488,11 +565,102 @@ class Thinking(Widget):
 
     def __init__(self, parent, state):
         super().__init__(parent, state, self.NUM_MOVES * 3 + 1, 48, 5, 59)
+        # SAN of the expanded PV as (fen, moves, sans), extended as the PV
+        # grows so that a frame only converts the moves that are new.
+        self.pv_san = None
 
-    def Draw(self):
+    # The pane shows the main search unless a what-if line is selected.
+    def Visible(self):
+        return not self.state['whatifview']
+
+    def Header(self):
         self.win.addstr(0, 0, "Move  Nodes", curses.color_pair(9))
+        stable = self.Stable()
+        if stable is None:
+            self.win.addstr("  (Shift+L) line")
+        elif stable >= config.STABLE_THRESHOLD:
+            self.win.addstr(f"  SETTLED {stable:4.0%}", curses.color_pair(7))
+        else:
+            self.win.addstr(f"  settled {stable:4.0%}")
+
+    # Confidence that the best move stays, see stability.py.
+    def Stable(self):
+        return self.state['stable']
+
+    def Thinking(self):
+        return self.state['thinking']
+
+    def Board(self):
+        return self.state['board']
+
+    def Prepared(self):
+        return self.state.get('prepared')
+
+    # SAN of the PV moves that fit in width, for the expanded candidate only.
+    def PvSan(self, board, pv, width):
+        fen = board.fen()
+        sans = []
+        if self.pv_san and self.pv_san[0] == fen:
+            (_, done, cached) = self.pv_san
+            for x, y, san in zip(done, pv, cached):
+                if x != y:
+                    break
+                sans.append(san)
+        board = board.copy(stack=False)
+        for x in pv[:len(sans)]:
+            board.push(DecodeMove(x))
+        size = sum(len(x) + 1 for x in sans)
+        for x in pv[len(sans):]:
+            if size > width:
+                break
+            move = DecodeMove(x)
+            if not board.is_legal(move):
+                break
+            sans.append(board.san(move))
+            size += len(sans[-1]) + 1
+            board.push(move)
+        self.pv_san = (fen, pv[:len(sans)], sans)
+        return sans
+
+    # The PV over two rows, in place of the candidate's bars.
+    def DrawPv(self, row, board, pv):
+        black = board.turn == chess.BLACK
+        line = 0
+        col = 0
+        self.win.move(row, 0)
+        for san in self.PvSan(board, pv, 2 * 46):
+            if col + len(san) + 1 > 46:
+                if line == 1:
+                    break
+                self.win.clrtoeol()
+                line = 1
+                col = 0
+                self.win.move(row + 1, 0)
+            self.win.addstr(' ' + san, curses.color_pair(5 if black else 22))
+            black = not black
+            col += len(san) + 1
+        self.win.clrtoeol()
+        if line == 0:
+            self.win.move(row + 1, 0)
+            self.win.clrtoeol()
 
-        moveses = self.state['thinking'].get('curr', {}).get('moves', {})
+    def Draw(self):
+        if not self.Visible():
+            return
+        self.Header()
+        thinking = self.Thinking()
+        board = self.Board()
+
+        moveses = thinking.get('curr', {}).get('moves', {})
+        # Prepared analysis is shown until the live search has more nodes.
+        prepared = self.Prepared()
+        is_prepared = bool(prepared) and max(
+            [x['nodes'] for x in moveses.values()] or [0]) < max(
+                x['nodes'] for x in prepared.values())
+        if is_prepared:
+            moveses = prepared
+            self.win.addstr("  [ PREPARED ]", curses.color_pair(7))
+        self.win.clrtoeol()
         moves = sorted(moveses.keys(),
                        key=lambda x: (moveses[x]['nodes'], x),
                        reverse=True)[:self.NUM_MOVES]
@@ -503,32 +671,54 @@ class Thinking(Widget):
 
         for i, m in enumerate(moves):
             move = moveses[m]
-            san = self.state['board'].san(chess.Move.from_uci(m))
-            self.win.addstr(i * 3 + 1, 0, f"{san:6}")
+            san = board.san(chess.Move.from_uci(m))
+            if (i == 0 and not is_prepared
+                    and (self.Stable() or 0) >= config.STABLE_THRESHOLD):
+                self.win.addstr(i * 3 + 1, 0, f"{san:6}", curses.color_pair(7))
+            else:
+                self.win.addstr(i * 3 + 1, 0, f"{san:6}")
+            text = f'N={move["nodes"]}'
+            if move.get('policy') is not None:
+                text += f' P={move["policy"]:.1f}%'
             progressbar.ProgressBar(win=self.win,
                                     width=32,
                                     value=move['nodes'],
                                     max_value=max_n,
-                                    text=f'N={move["nodes"]}',
+                                    text=text,
                                     bar_color=19,
                                     remainder_color=20,
                                     text_color=21)
 
-            prev = self.state['thinking'].get('prev', {})
-            if 'moves' in prev and m in prev['moves']:
-                prev_move = prev['moves'][m]
-                delta = int(move['nodes'] - prev_move['nodes']) / (
-                    self.state['thinking']['curr']['time'] -
-                    self.state['thinking']['prev']['time'])
-                self.win.addstr(f" +{ShortenNum(delta, 4)}/s".ljust(8))
+            prev = thinking.get('prev', {})
+            if not is_prepared and 'moves' in prev and m in prev['moves']:
+                elapsed = (thinking['curr']['time'] -
+                           prev.get('time', 0))
+                if elapsed > 0:
+                    prev_move = prev['moves'][m]
+                    delta = max(0,
+                                move['nodes'] - prev_move['nodes']) / elapsed
+                    self.win.addstr(f" +{ShortenNum(delta, 4)}/s".ljust(8))
+            if i + 1 == self.state['pvexpand']:
+                if is_prepared:
+                    pv = [EncodeMove(x) for x in move.get('pv', [])]
+                else:
+                    pv = thinking['curr'].get('pvs', {}).get(m)
+                if pv:
+                    self.DrawPv(i * 3 + 2, board, pv)
+                    continue
             self.win.move(i * 3 + 2, 0)
-            progressbar.WdlBar(self.win, 46, move['wdl'].wins,
-                               move['wdl'].draws, move['wdl'].losses, 12, 13,
-                               14, 15, 16, 17)
+            if move['wdl'] is not None:
+                progressbar.WdlBar(self.win, 46, move['wdl'].wins,
+                                   move['wdl'].draws, move['wdl'].losses, 12,
+                                   13, 14, 15, 16, 17)
+            else:
+                self.win.addstr(" " * 46)
             self.win.move(i * 3 + 3, 0)
-            if 'score' in move and move['score'].score() is not None:
+            if move.get('score') is None:
+              self.win.addstr(i * 3 + 3, 0, " " * 46)
+            elif move['score'].score() is not None:
               progressbar.TickBar(self.win, 46, move['score'].score() / 20000.0 + 0.5, 24, 23)
-            elif 'score' in move and move['score'].mate() is not None:
+            elif move['score'].mate() is not None:
               self.win.addstr(i * 3 + 3, 0, " " * 46)
               self.win.addstr(i * 3 + 3, 0, " Checkmate in %d" % (abs(move['score'].mate())))
             else:
@@ -536,6 +726,53 @@ class Thinking(Widget):
         self.win.clrtobot()
         super().Draw()
 
+    def OnKey(self, key):
+        if not self.Visible() or key != ord('L'):  # Shift+L
+            return False
+        # Expands the next candidate's PV, then none.
+        self.state['pvexpand'] = (self.state['pvexpand'] + 1) % (
+            self.NUM_MOVES + 1)
+        return True
+
+    def OnMouse(self, mouse):
+        if not self.Visible():
+            return False
+        y = mouse[2] - self.win.getbegyx()[0]
+        if y < 1:
+            return False
+        # Clicking a candidate expands its PV, or collapses it again.
+        idx = (y - 1) // 3 + 1
+        self.state['pvexpand'] = 0 if self.state['pvexpand'] == idx else idx
+        return True
+
+
+# Analysis of the selected what-if line, in place of Thinking.
+class WhatIf(Thinking):
+
+    def Line(self):
+        return self.state['whatif'][self.state['whatifview'] - 1]
+
+    def Visible(self):
+        return bool(self.state['whatifview'])
+
+    def Header(self):
+        line = self.Line()
+        self.win.addstr(0, 0, f"What if {line['san']}?", curses.color_pair(9))
+        self.win.addstr(f" ({self.state['whatifview']}/"
+                        f"{len(self.state['whatif'])}) {line['status']}")
+
+    def Thinking(self):
+        return self.Line()['thinking']
+
+    def Stable(self):
+        return None
+
+    def Board(self):
+        return chess.Board(self.Line()['fen'])
+
+    def Prepared(self):
+        return None
+
 
 class MoveInput(Widget):
 
@@ -543,10 +780,32 @@ class MoveInput(Widget):
         super().__init__(parent, state, 2, 39, 34, 18)
 
     def Draw(self):
-        self.win.addstr(0, 0, "Enter move (e.g. e2e4 or h2h1n): ",
+        self.win.addstr(0, 0, "Enter move (e.g. e2e4 or nf3): ",
                         curses.color_pair(9))
         self.win.addstr(self.state['nextmove'], curses.color_pair(10))
         self.win.clrtoeol()
+        self.win.move(1, 0)
+        premove = self.state['premove']
+        typed = self.state['nextmove']
+        if premove or not typed:
+            # An armed premove stays in sight while a move is typed.
+            self.win.addstr("Premove: " if typed else "Premove (Shift+W): ")
+            if premove == '*':
+                self.win.addstr("[ PRED]", curses.color_pair(7))
+            elif premove:
+                self.win.addstr(f"[{premove:^5}]", curses.color_pair(7))
+            else:
+                self.win.addstr("[ OFF ]")
+            self.win.addstr(' ')
+        index = self.state['moveindex']
+        if typed and index:
+            # Moves the typed text can still become.
+            text = ' '.join(index.san[x] for x in index.Candidates(typed))
+            width = 38 - self.win.getyx()[1]
+            if len(text) > width:
+                text = text[:width - 3] + '...'
+            self.win.addstr(text)
+        self.win.clrtoeol()
         super().Draw()
 
     def OnKey(self, key):
@@ -554,27 +813,28 @@ class MoveInput(Widget):
         if key in [8, 127, 263]:  # Backspace
             self.state['nextmove'] = self.state['nextmove'][:-1]
             return True
+        index = self.state['moveindex']
+        if key == 10 and index and index.Complete(st):
+            # Typed SAN, also one shared by several moves.
+            self.state['nextmove'] = index.Complete(st)
+            self.state['commitmove'] = True
+            return True
         if key == 10 and len(st) >= 4:
             self.state['commitmove'] = True
-        if len(st) in [0, 2]:
-            for x in 'abcdefgh':
-                if key == ord(x):
-                    self.state['nextmove'] += x
-                    return True
-            return False
-        if len(st) in [1, 3]:
-            for x in '12345678':
-                if key == ord(x):
-                    self.state['nextmove'] += x
-                    return True
+        if key == 10 and not st and self.state['premove']:
+            self.state['playpremove'] = True
+            return True
+        if index is None or not 32 < key < 127:
             return False
-        if len(st) in [4]:
-            for x in 'qnkb':
-                if key == ord(x):
-                    self.state['nextmove'] += x
-                    return True
+        candidates = index.Candidates(st + chr(key))
+        if not candidates:
+            # Can't become a legal move.
             return False
-        return False
+        if len(candidates) == 1:
+            self.state['nextmove'] = candidates[0]
+        else:
+            self.state['nextmove'] = st + chr(key)
+        return True
 
 
 class Timer(Widget):
@@ -609,7 +869,7 @@ class Timer(Widget):
                 color = 0
             elif not self.state['timerenabled']:
                 color = 10
-            elif tim < 120:
+            elif tim < config.LOW_TIME:
                 color = 6
             else:
                 color = 7
@@ -667,13 +927,16 @@ class Timer(Widget):
 
 
 class MoveList(Widget):
-    NUM_PLY = 40
+    NUM_PLY = 33
 
     def __init__(self, parent, state):
         super().__init__(parent, state, 1 + self.NUM_PLY, 65, 1, 105)
 
     def Draw(self):
+        if self.state['explorer']:
+            return
         self.win.addstr(0, 3, "Moves:", curses.color_pair(9))
+        self.win.addstr("  (Shift+O) explorer")
         moves = []
         wdls = []
         brd = self.state['board'].root()
@@ -711,6 +974,128 @@ class MoveList(Widget):
         super().Draw()
 
 
+# Games from the database that reached the position on the board, in place of
+# MoveList.
+class Explorer(Widget):
+    NUM_MOVES = 16
+
+    def __init__(self, parent, state):
+        super().__init__(parent, state, 1 + MoveList.NUM_PLY, 65, 1, 105)
+
+    def Draw(self):
+        if not self.state['explorer']:
+            return
+        self.win.addstr(0, 3, "Explorer:", curses.color_pair(9))
+        info = self.state['explorerinfo']
+        if not info:
+            self.win.clrtobot()
+            super().Draw()
+            return
+        if 'error' in info:
+            self.win.addstr(f" {info['error']}")
+            self.win.clrtobot()
+            super().Draw()
+            return
+        self.win.addstr(f" {info['games']} games")
+        self.win.clrtoeol()
+        row = 1
+        for san, w, d, l in info['moves'][:self.NUM_MOVES]:
+            total = w + d + l
+            self.win.addstr(row, 0, f"{san:7}{total:7} "
+                            f"{100 * (w + d / 2) / total:5.1f}% ")
+            progressbar.WdlBar(self.win, 43, w, d, l, 12, 13, 14, 15, 16, 17)
+            row += 1
+        self.win.addstr(row, 0, "\n")
+        self.win.addstr(row + 1, 3, "Games:", curses.color_pair(9))
+        for i, line in enumerate(info['list']):
+            self.win.addstr(row + 2 + i, 0, line[:64])
+            self.win.clrtoeol()
+        self.win.clrtobot()
+        super().Draw()
+
+    def OnKey(self, key):
+        if key == ord('O'):  # Shift+O
+            self.state['explorer'] = not self.state['explorer']
+            return True
+        return False
+
+
+class EvalGraph(Widget):
+    ROWS = 6
+    COLUMNS = 62
+
+    def __init__(self, parent, state):
+        # Right of Thinking's window, which clears to its bottom every frame.
+        super().__init__(parent, state, self.ROWS + 1, self.COLUMNS + 1, 35,
+                         107)
+        # The move_info entries drawn so far, one column per ply until the
+        # game gets longer than the graph, then two, four...
+        self.infos = []
+        self.plies_per_column = 1
+        # Hash of the position after the plies drawn, None before the first
+        # frame.
+        self.hash = None
+
+    def ColumnWdl(self, col):
+        plies = self.infos[col * self.plies_per_column:(col + 1) *
+                           self.plies_per_column]
+        for info in reversed(plies):
+            if isinstance(info, chess.engine.Wdl):
+                return info
+        return None
+
+    # Plies of the game still drawn. Pushed moves leave the position after
+    # the drawn ones in place, anything else is compared from the start.
+    def Kept(self, info, board):
+        n = len(self.infos)
+        if (self.hash is not None and n <= len(info)
+                and len(info) == len(board.move_stack)
+                and rules.HashAt(board, n) == self.hash):
+            return n
+        n = 0
+        while (n < min(len(self.infos), len(info))
+               and info[n] == self.infos[n]):
+            n += 1
+        return n
+
+    def Draw(self):
+        # Only the columns of plies that were pushed or undone are redrawn.
+        info = self.state['move_info']
+        board = self.state['board']
+        n = self.Kept(info, board)
+        if n == len(self.infos) == len(info) and self.hash is not None:
+            super().Draw()
+            return
+        self.hash = chess.polyglot.zobrist_hash(board)
+        old_columns = -(-len(self.infos) // self.plies_per_column)
+        del self.infos[n:]
+        self.infos.extend(info[n:])
+        first = n // self.plies_per_column
+        plies_per_column = 1
+        while len(self.infos) > plies_per_column * self.COLUMNS:
+            plies_per_column *= 2
+        if plies_per_column != self.plies_per_column:
+            self.plies_per_column = plies_per_column
+            first = 0
+        columns = -(-len(self.infos) // self.plies_per_column)
+
+        self.win.addstr(0, 0, "Eval:", curses.color_pair(9))
+        self.win.addstr(f" {len(self.infos)} plies")
+        if self.plies_per_column > 1:
+            self.win.addstr(f", {self.plies_per_column} per column")
+        self.win.clrtoeol()
+        for col in range(first, max(columns, old_columns)):
+            wdl = self.ColumnWdl(col) if col < columns else None
+            if wdl is None:
+                for row in range(self.ROWS):
+                    self.win.addstr(row + 1, col, ' ')
+            else:
+                progressbar.WdlColumn(self.win, 1, col, self.ROWS, wdl.wins,
+                                      wdl.draws, wdl.losses,
+                                      (12, 13, 14, 15, 17, 16))
+        super().Draw()
+
+
 class Status(Widget):
 
     def __init__(self, parent, state):
@@ -718,23 +1103,10 @@ class Status(Widget):
 
     def Draw(self):
         self.win.addstr(0, 0, "Status: ", curses.color_pair(9))
-        if self.state['board'].is_checkmate():
-            self.win.addstr("[ CHECKMATE ]", curses.color_pair(7))
-        elif self.state['board'].is_stalemate():
-            self.win.addstr("[ DRAW: STALEMATE ]", curses.color_pair(7))
-        elif self.state['board'].is_insufficient_material():
-            self.win.addstr("[ DRAW: NO MATERIAL ]", curses.color_pair(7))
-        elif self.state['board'].is_fifty_moves():
-            self.win.addstr("[ DRAW: FIFTY MOVES ]", curses.color_pair(7))
-        elif self.state['board'].is_repetition(3):
-            self.win.addstr("[ DRAW: THREEFOLD REPETITION ]",
-                            curses.color_pair(7))
-        elif self.state['board'].can_claim_fifty_moves():
-            self.win.addstr("[ DRAW POSSIBLE: FIFTY MOVES ]",
-                            curses.color_pair(6))
-        elif self.state['board'].can_claim_threefold_repetition():
-            self.win.addstr("[ DRAW POSSIBLE: THREEFOLD REP ]",
-                            curses.color_pair(6))
+        (result, label) = rules.Termination(self.state['board'])
+        if label:
+            self.win.addstr(f"[ {label} ]",
+                            curses.color_pair(7 if result else 6))
         else:
             self.win.addstr(config.STATUS or "game is not finished.")
         self.win.clrtoeol()
@@ -746,8 +1118,22 @@ class Status(Widget):
             (self.state.get('depth', 0), self.state.get('seldepth', 0)))
         self.win.addstr("  NPS:", curses.color_pair(9))
         self.win.addstr("%7d" % self.state.get('nps', 0))
+        self.win.move(2, 0)
+        if self.state['boards']:
+            self.win.addstr("Board(G):", curses.color_pair(9))
+            self.win.addstr(self.state['boards'][:34] + ' ')
+        if self.state.get('alert'):
+            self.win.addstr(self.state['alert'][:44 - self.win.getyx()[1]],
+                            curses.color_pair(6))
+        self.win.clrtoeol()
         super().Draw()
 
+    def OnKey(self, key):
+        if key == ord('G'):
+            self.state['switchboard'] = True
+            return True
+        return False
+
 
 class MoveReady(Widget):
 
@@ -817,11 +1203,17 @@ def CreateWidgets(stdscr, state):
             Engine,
             Timer,
             Thinking,
+            WhatIf,
             MoveList,
+            Explorer,
+            EvalGraph,
             Promotions,
             MoveReady,
             MoveInput,
     ]:
+        if w is Duck and config.REMOTE_MODE:
+            # Animation costs bandwidth on every frame.
+            continue
         try:
             widgets.append(w(stdscr, state))
         except TooSmall:
@@ -834,6 +1226,14 @@ class Tui:
     def __init__(self, stdscr, state):
         self.state = state
         self.scr = stdscr
+        self.scheduler = RenderScheduler(
+            state, config.REMOTE_MAX_FPS if config.REMOTE_MODE else None)
+        if config.REMOTE_MODE:
+            # Lets curses scroll the move list instead of repainting it.
+            stdscr.idlok(True)
+        progressbar.UseAscii(ASCII)
+        if ASCII and state['piecedisplay'] not in ASCII_PIECES:
+            state['piecedisplay'] = ASCII_PIECES[0]
         curses.mousemask(curses.BUTTON1_CLICKED)
         curses.init_pair(1, WHITE_PIECES,
                          DARK_SQUARES)  # White piece on dark square
@@ -876,6 +1276,13 @@ class Tui:
 
         self.widgets = CreateWidgets(self.scr, state)
 
+    def SetState(self, state):
+        self.state = state
+        self.scheduler.state = state
+        for x in self.widgets:
+            x.state = state
+        self.scheduler.Urgent()
+
     def Draw(self):
         for x in self.widgets:
             try:
@@ -883,12 +1290,25 @@ class Tui:
             except curses.error:
                 logging.exception("Unable to draw widget: %s" % repr(x))
         curses.doupdate()
+        self.scheduler.FrameDrawn()
+
+    def Alert(self):
+        curses.flash()
+        curses.beep()
 
-    def Process(self):
+    def Process(self, timeout=0):
+        x = self.ReadKey(timeout)
+        if x is not None:
+            self.HandleKey(x)
+
+    def ReadKey(self, timeout=0):
+        self.scr.timeout(int(timeout * 1000))
         x = self.scr.getch()
-        if x == -1:
-            return
+        return None if x == -1 else x
+
+    def HandleKey(self, x):
         logging.info("Got key: %d" % x)
+        self.scheduler.Urgent()
         if x == 3:  # Ctrl-C
             raise KeyboardInterrupt
         if x == curses.KEY_RESIZE:
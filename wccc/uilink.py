@@ -0,0 +1,299 @@
+import chess.polyglot
+import copy
+import curses
+import logging
+import os
+import pickle
+import select
+import socket
+import struct
+import time
+from . import config
+from .moveindex import MoveIndex
+from .scheduler import RenderScheduler
+
+# Runs the controller and the curses UI as two processes (SPLIT_UI), so that
+# a slow frame doesn't delay engine output and an info burst doesn't make the
+# UI stutter. They talk over a unix socket with length prefixed pickles:
+#   controller -> UI: {'ack', 'alerts', 'state'}, the state of the board on
+#                     screen, at most at the controller's frame rate.
+#   UI -> controller: {'seq', 'game', 'set', 'add'}, state keys changed by a
+#                     key or click in the UI, applied before the controller's
+#                     Update. The clocks keep running in the controller, so
+#                     changes to them are sent as amounts to add.
+# The controller never blocks on the UI: while a snapshot is still being
+# sent, newer ones are skipped and only the latest is sent once the UI reads
+# again. Either side can be restarted, the UI reconnects.
+
+HEADER = struct.Struct('<I')
+
+# Not sent to the UI, which builds its own.
+LOCAL_KEYS = ['moveindex']
+# Never changed by keys, so not compared when looking for changes.
+DISPLAY_KEYS = ['board', 'thinking', 'move_info', 'prepared', 'moveindex']
+# Changed by the controller between frames: a key's change is sent as the
+# difference, added to the value the controller has by then.
+DELTA_KEYS = ['timer', 'movetimer', 'drift_compensation']
+# Only the controller's own value is right.
+CONTROLLER_KEYS = ['lasttimestamp']
+
+
+def Difference(before, after):
+    if isinstance(after, list):
+        return [y - x for x, y in zip(before, after)]
+    return after - before
+
+
+def Add(value, delta):
+    if isinstance(value, list):
+        return [x + y for x, y in zip(value, delta)]
+    return value + delta
+
+
+# Applies a command from the UI to state, in the controller or, until it is
+# acknowledged, to the newer states the UI receives.
+def ApplyCommand(state, command):
+    state.update(copy.deepcopy(command['set']))
+    for key, delta in command['add'].items():
+        state[key] = Add(state[key], delta)
+    if 'drift_compensation' in command['add']:
+        state['drift_compensation'] = min(
+            config.INCREMENT, max(0, state['drift_compensation']))
+
+
+def Pack(obj):
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    return HEADER.pack(len(data)) + data
+
+
+class FrameReader:
+
+    def __init__(self):
+        self.buf = b''
+
+    def Feed(self, data):
+        self.buf += data
+        res = []
+        while len(self.buf) >= HEADER.size:
+            (size, ) = HEADER.unpack_from(self.buf)
+            if len(self.buf) < HEADER.size + size:
+                break
+            res.append(pickle.loads(self.buf[HEADER.size:HEADER.size + size]))
+            self.buf = self.buf[HEADER.size + size:]
+        return res
+
+
+# Stands in for Tui in the controller process.
+class UiServer:
+
+    def __init__(self, path, state, games):
+        self.state = state
+        self.games = games
+        self.scheduler = RenderScheduler(state)
+        self.path = path
+        self.ack = 0
+        self.alerts = 0
+        self.conn = None
+        self.reader = FrameReader()
+        self.out = b''
+        self.dirty = True
+        if os.path.exists(path):
+            os.unlink(path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        os.chmod(path, 0o600)
+        self.listener.listen(1)
+        self.listener.setblocking(False)
+        logging.info(f"Waiting for the UI on {path}")
+
+    def SetState(self, state):
+        self.state = state
+        self.scheduler.state = state
+        self.scheduler.Urgent()
+
+    def Alert(self):
+        self.alerts += 1
+
+    def Disconnect(self):
+        logging.info("UI disconnected")
+        self.conn.close()
+        self.conn = None
+        self.out = b''
+
+    def Process(self, timeout=0):
+        rlist = [self.listener] + ([self.conn] if self.conn else [])
+        wlist = [self.conn] if self.conn and self.out else []
+        (readable, writable, _) = select.select(rlist, wlist, [], timeout)
+        if self.listener in readable:
+            if self.conn:
+                self.Disconnect()
+            (self.conn, _) = self.listener.accept()
+            self.conn.setblocking(False)
+            self.reader = FrameReader()
+            self.ack = 0
+            self.dirty = True
+            self.scheduler.Urgent()
+            logging.info("UI connected")
+        elif self.conn in readable:
+            try:
+                data = self.conn.recv(65536)
+            except OSError:
+                data = b''
+            if not data:
+                self.Disconnect()
+                return
+            for command in self.reader.Feed(data):
+                self.Apply(command)
+        if self.conn in writable:
+            self.Flush()
+
+    def Apply(self, command):
+        state = self.games[command['game']]
+        logging.info("UI set %s on board %d" % (sorted(
+            list(command['set']) + list(command['add'])), command['game'] + 1))
+        ApplyCommand(state, command)
+        self.ack = command['seq']
+        self.scheduler.Urgent()
+
+    def Flush(self):
+        try:
+            sent = self.conn.send(self.out)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.Disconnect()
+            return
+        self.out = self.out[sent:]
+        if not self.out and self.dirty:
+            self.Draw()
+
+    def Draw(self):
+        self.scheduler.FrameDrawn()
+        if not self.conn:
+            return
+        if self.out:
+            # The UI is behind, send the latest state once it catches up.
+            self.dirty = True
+            return
+        self.dirty = False
+        state = {k: v for k, v in self.state.items() if k not in LOCAL_KEYS}
+        self.out = Pack({
+            'ack': self.ack,
+            'alerts': self.alerts,
+            'state': state,
+        })
+        self.Flush()
+
+
+def Snapshot(state):
+    return {
+        k: copy.deepcopy(v)
+        for k, v in state.items() if k not in DISPLAY_KEYS
+    }
+
+
+def RunUiClient(stdscr, path, relay=None):
+    # Imported here, the controller process doesn't need curses widgets.
+    from .tui import Tui
+    conn = None
+    reader = FrameReader()
+    tui = None
+    state = None
+    seq = 0
+    pending = []
+    alerts = None
+    index_key = None
+    while True:
+        if conn is None:
+            try:
+                conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                conn.connect(path)
+                reader = FrameReader()
+                alerts = None
+                seq = 0
+                pending = []
+                logging.info(f"Connected to the controller on {path}")
+            except OSError:
+                conn = None
+                if tui is None:
+                    stdscr.addstr(0, 0, f"Waiting for the controller on "
+                                  f"{path}...")
+                    stdscr.refresh()
+                else:
+                    state['statusbar'] = "Controller not running, retrying."
+                    tui.Draw()
+                time.sleep(0.5)
+                continue
+
+        latest = None
+        while select.select([conn], [], [], 0)[0]:
+            try:
+                data = conn.recv(1 << 20)
+            except OSError:
+                data = b''
+            if not data:
+                logging.info("Controller disconnected")
+                conn.close()
+                conn = None
+                break
+            msgs = reader.Feed(data)
+            if msgs:
+                latest = msgs[-1]
+        if latest:
+            state = latest['state']
+            pending = [x for x in pending if x['seq'] > latest['ack']]
+            for command in pending:
+                ApplyCommand(state, command)
+            if alerts is not None and latest['alerts'] > alerts:
+                curses.flash()
+                curses.beep()
+            alerts = latest['alerts']
+            board = state['board']
+            # Frames may skip several plies, as in Controller.PositionKey.
+            key = (state['game'], len(board.move_stack),
+                   chess.polyglot.zobrist_hash(board))
+            if key != index_key:
+                index_key = key
+                index = MoveIndex(board)
+            state['moveindex'] = index
+            if tui is None:
+                stdscr.clear()
+                tui = Tui(stdscr, state)
+            else:
+                tui.SetState(state)
+        if tui is None:
+            time.sleep(0.01)
+            continue
+
+        if relay:
+            state['termbps'] = relay.bps
+        key = tui.ReadKey(tui.scheduler.WaitTime())
+        if key is not None:
+            before = Snapshot(state)
+            tui.HandleKey(key)
+            changes = {
+                k: v
+                for k, v in Snapshot(state).items()
+                if before.get(k) != v and k not in CONTROLLER_KEYS
+            }
+            if changes and conn:
+                seq += 1
+                command = {
+                    'seq': seq,
+                    'game': state['game'],
+                    'set': {
+                        k: v
+                        for k, v in changes.items() if k not in DELTA_KEYS
+                    },
+                    'add': {
+                        k: Difference(before[k], v)
+                        for k, v in changes.items() if k in DELTA_KEYS
+                    },
+                }
+                pending.append(command)
+                try:
+                    conn.sendall(Pack(command))
+                except OSError:
+                    pass
+        if tui.scheduler.FrameDue(False):
+            tui.Draw()
@@ -0,0 +1,125 @@
+import curses
+
+# In-memory stand-in for a curses window, implementing the part of the API
+# the widgets use, so they can be drawn (and timed) without a terminal.
+# Follows curses where the widgets depend on it: '\n' clears the rest of the
+# line, text wraps, and writing past the bottom right corner raises
+# curses.error.
+
+
+def ColorPair(n):
+    # Same encoding as ncurses' COLOR_PAIR().
+    return n << 8
+
+
+# curses.color_pair() needs initscr(); widgets drawn on virtual windows get
+# the ncurses encoding instead.
+def Install():
+    curses.color_pair = ColorPair
+
+
+class VirtualWindow:
+
+    def __init__(self, rows, cols, parent=None, y=0, x=0):
+        self.rows = rows
+        self.cols = cols
+        self.root = parent.root if parent else self
+        self.beg_y = (parent.beg_y if parent else 0) + y
+        self.beg_x = (parent.beg_x if parent else 0) + x
+        self.cy = 0
+        self.cx = 0
+        self.background = ' '
+        self.background_attr = 0
+        self.refreshes = 0
+        if parent is None:
+            self.chars = [[' '] * cols for _ in range(rows)]
+            self.attrs = [[0] * cols for _ in range(rows)]
+
+    def derwin(self, rows, cols, y, x):
+        if y + rows > self.rows or x + cols > self.cols:
+            raise curses.error('derwin() returned ERR')
+        return VirtualWindow(rows, cols, self, y, x)
+
+    def getmaxyx(self):
+        return (self.rows, self.cols)
+
+    def getbegyx(self):
+        return (self.beg_y, self.beg_x)
+
+    def getyx(self):
+        return (self.cy, self.cx)
+
+    def enclose(self, y, x):
+        return (self.beg_y <= y < self.beg_y + self.rows
+                and self.beg_x <= x < self.beg_x + self.cols)
+
+    def move(self, y, x):
+        if not (0 <= y < self.rows and 0 <= x < self.cols):
+            raise curses.error('wmove() returned ERR')
+        (self.cy, self.cx) = (y, x)
+
+    def Put(self, y, x, ch, attr):
+        self.root.chars[self.beg_y + y][self.beg_x + x] = ch
+        self.root.attrs[self.beg_y + y][self.beg_x + x] = attr
+
+    def addstr(self, *args):
+        if len(args) >= 3:
+            self.move(args[0], args[1])
+            args = args[2:]
+        text = args[0]
+        attr = args[1] if len(args) > 1 else 0
+        for ch in text:
+            if ch == '\n':
+                self.clrtoeol()
+                if self.cy + 1 >= self.rows:
+                    raise curses.error('addstr() returned ERR')
+                (self.cy, self.cx) = (self.cy + 1, 0)
+                continue
+            self.Put(self.cy, self.cx, ch, attr)
+            self.cx += 1
+            if self.cx == self.cols:
+                if self.cy + 1 >= self.rows:
+                    self.cx -= 1
+                    raise curses.error('addstr() returned ERR')
+                (self.cy, self.cx) = (self.cy + 1, 0)
+
+    def chgat(self, y, x, num, attr):
+        self.move(y, x)
+        for i in range(x, min(self.cols, x + num)):
+            self.root.attrs[self.beg_y + y][self.beg_x + i] = attr
+
+    def clrtoeol(self):
+        for x in range(self.cx, self.cols):
+            self.Put(self.cy, x, self.background, self.background_attr)
+
+    def clrtobot(self):
+        self.clrtoeol()
+        for y in range(self.cy + 1, self.rows):
+            for x in range(self.cols):
+                self.Put(y, x, self.background, self.background_attr)
+
+    def erase(self):
+        for y in range(self.rows):
+            for x in range(self.cols):
+                self.Put(y, x, self.background, self.background_attr)
+        (self.cy, self.cx) = (0, 0)
+
+    def bkgdset(self, ch, attr=0):
+        self.background = ch
+        self.background_attr = attr
+
+    def bkgd(self, ch, attr=0):
+        self.bkgdset(ch, attr)
+        for y in range(self.rows):
+            for x in range(self.cols):
+                self.root.attrs[self.beg_y + y][self.beg_x + x] = attr
+
+    def noutrefresh(self):
+        self.refreshes += 1
+
+    # The window's text, for checking what was drawn.
+    def Text(self):
+        return '\n'.join(
+            ''.join(self.root.chars[self.beg_y + y][self.beg_x:self.beg_x +
+                                                     self.cols])
+            for y in range(self.rows))
@@ -0,0 +1,108 @@
+import logging
+import queue
+import threading
+import time
+import chess
+import chess.engine
+from .movecodec import EncodeMove
+
+# Second engine process for what-if lines (Shift+I): the operator queues a
+# move in the current position, and the position after it is analysed with a
+# node budget while the main search keeps running. Lines are analysed one at
+# a time in queue order; the engine is started on the first one.
+#
+# Each line is a dict in state['whatif'], updated from the analysis thread by
+# replacing its values, never by adding keys, so the UI can draw it anytime:
+#   move, san:  the what-if move.
+#   base:       FEN it was played in; lines are dropped when the game moves.
+#   fen:        FEN after it, the position analysed.
+#   status:     queued, running, done or failed.
+#   thinking:   same format as state['thinking'].
+#   cancelled:  set by the controller to stop the analysis.
+
+
+def NewLine(board, move):
+    after = board.copy(stack=False)
+    after.push(move)
+    return {
+        'move': move.uci(),
+        'san': board.san(move),
+        'base': board.fen(),
+        'fen': after.fen(),
+        'status': 'queued',
+        'thinking': {},
+        'cancelled': False,
+    }
+
+
+class WhatIfEngine:
+
+    def __init__(self, command_line, nodes, multipv):
+        self.command_line = command_line
+        self.nodes = nodes
+        self.multipv = multipv
+        self.jobs = queue.Queue()
+        self.thread = None
+
+    def Add(self, line):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.Loop,
+                                           name='whatif',
+                                           daemon=True)
+            self.thread.start()
+        self.jobs.put(line)
+
+    def Loop(self):
+        try:
+            logging.info("Starting what-if engine %s" %
+                         repr(self.command_line))
+            engine = chess.engine.SimpleEngine.popen_uci(self.command_line,
+                                                         timeout=60)
+        except Exception:
+            logging.exception("What-if engine failed to start")
+            while True:
+                self.jobs.get()['status'] = 'failed'
+        while True:
+            line = self.jobs.get()
+            if line['cancelled']:
+                continue
+            try:
+                self.Analyse(engine, line)
+            except chess.engine.EngineError:
+                logging.exception("What-if analysis of %s failed" %
+                                  line['move'])
+                line['status'] = 'failed'
+
+    def Analyse(self, engine, line):
+        logging.info(f"What-if analysis of {line['move']} in {line['base']}")
+        line['status'] = 'running'
+        start = time.monotonic()
+        curr = {'time': 0, 'moves': {}, 'pv': [], 'pvs': {}}
+        with engine.analysis(chess.Board(line['fen']),
+                             chess.engine.Limit(nodes=self.nodes),
+                             multipv=self.multipv) as analysis:
+            for info in analysis:
+                if line['cancelled']:
+                    analysis.stop()
+                    continue
+                if not info.get('pv'):
+                    continue
+                moves = dict(curr['moves'])
+                pvs = dict(curr['pvs'])
+                pvs[info['pv'][0].uci()] = [EncodeMove(x) for x in info['pv']]
+                moves[info['pv'][0].uci()] = {
+                    'score': info['score'].white() if 'score' in info else None,
+                    'wdl': info['wdl'].white() if 'wdl' in info else None,
+                    'nodes': info.get('nodes', 0),
+                }
+                curr = {
+                    'time': time.monotonic() - start,
+                    'moves': moves,
+                    'pvs': pvs,
+                    'pv': (info['pv'] if info.get('multipv', 1) == 1 else
+                           curr['pv']),
+                }
+                line['thinking'] = {'curr': curr}
+        line['status'] = 'done'
+        logging.info("What-if analysis of %s done in %.1fs" %
+                     (line['move'], time.monotonic() - start))
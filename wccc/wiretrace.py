@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# Optional trace of every UCI line exchanged with the engine (WIRE_TRACE),
+# with monotonic nanosecond timestamps, plus markers from the controller for
+# when a bestmove was picked up and shown. The report splits each move's time
+# into go -> first info, go -> bestmove (stop -> bestmove for forced moves)
+# and bestmove -> move ready -> on screen, to tell engine latency from
+# python-chess and UI loop latency.
+#
+#   python3 -m wccc.wiretrace logs/wire-20240101-120000.bin [--dump]
+
+import argparse
+import statistics
+import struct
+import threading
+import time
+import chess.engine
+
+# Monotonic time in ns, kind, length of the line that follows.
+RECORD = struct.Struct('<QBH')
+SENT = 0
+RECEIVED = 1
+MARK = 2
+KIND_NAMES = ['<<', '>>', '==']
+
+
+class WireTrace:
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'wb')
+        # Relates the monotonic timestamps to wall time.
+        self.Add(MARK, 'start %.6f' % time.time())
+
+    def Add(self, kind, line):
+        now = time.monotonic_ns()
+        data = line.encode('utf-8')[:0xffff]
+        with self.lock:
+            self.file.write(RECORD.pack(now, kind, len(data)))
+            self.file.write(data)
+            # Flushed once per move, and for controller markers.
+            if kind == MARK or data.startswith(b'bestmove'):
+                self.file.flush()
+
+    def Mark(self, what):
+        self.Add(MARK, what)
+
+    # UciProtocol that records the lines it sends and receives, for
+    # SimpleEngine.popen().
+    def Protocol(self):
+        trace = self
+
+        class TracedUciProtocol(chess.engine.UciProtocol):
+
+            def send_line(self, line):
+                trace.Add(SENT, line)
+                super().send_line(line)
+
+            def _line_received(self, line):
+                trace.Add(RECEIVED, line)
+                super()._line_received(line)
+
+        return TracedUciProtocol
+
+
+def ReadTrace(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    res = []
+    pos = 0
+    while pos + RECORD.size <= len(data):
+        (t, kind, size) = RECORD.unpack_from(data, pos)
+        pos += RECORD.size
+        if pos + size > len(data):
+            # Cut short by a crash.
+            break
+        res.append((t, kind, data[pos:pos + size].decode('utf-8', 'replace')))
+        pos += size
+    return res
+
+
+# One dict of timestamps per go command.
+def Searches(records):
+    res = []
+    # Markers belong to the last search that returned a bestmove, the next
+    # go may already have been sent.
+    done = None
+    for t, kind, line in records:
+        if kind == SENT and line.startswith('go'):
+            res.append({'go': t, 'line': line})
+        elif kind == MARK and done:
+            done.setdefault(line, t)
+        elif not res:
+            continue
+        elif kind == SENT and line == 'stop':
+            res[-1].setdefault('stop', t)
+        elif kind == RECEIVED and line.startswith('info'):
+            res[-1].setdefault('info', t)
+        elif kind == RECEIVED and line.startswith('bestmove'):
+            res[-1].setdefault('bestmove', t)
+            res[-1]['move'] = (line.split() + ['-'])[1]
+            done = res[-1]
+    return res
+
+
+COLUMNS = [
+    ('first info', 'go', 'info'),
+    ('go-best', 'go', 'bestmove'),
+    ('stop-best', 'stop', 'bestmove'),
+    ('best-ready', 'bestmove', 'moveready'),
+    ('ready-shown', 'moveready', 'shown'),
+]
+
+
+def Report(records):
+    searches = Searches(records)
+    if not searches:
+        print("No searches in the trace")
+        return
+    start = records[0][0]
+    print(f"{'time':>9} {'move':6}" +
+          ''.join(f"{name:>12}" for name, _, _ in COLUMNS))
+    values = {name: [] for name, _, _ in COLUMNS}
+    for search in searches:
+        line = (f"{(search['go'] - start) / 1e9:8.1f}s "
+                f"{search.get('move', '-'):6}")
+        for name, begin, end in COLUMNS:
+            if begin in search and end in search:
+                ms = (search[end] - search[begin]) / 1e6
+                values[name].append(ms)
+                line += f"{ms:10.1f}ms"
+            else:
+                line += f"{'-':>12}"
+        print(line)
+    print()
+    for name, _, _ in COLUMNS:
+        x = sorted(values[name])
+        if x:
+            print(f"{name:12} n={len(x):<5} median {statistics.median(x):9.1f}"
+                  f"ms  p95 {x[int(len(x) * 0.95)]:9.1f}ms  "
+                  f"max {x[-1]:9.1f}ms")
+
+
+def Dump(records):
+    start = records[0][0] if records else 0
+    for t, kind, line in records:
+        print(f"{(t - start) / 1e6:12.3f} {KIND_NAMES[kind]} {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='UCI wire trace latencies.')
+    parser.add_argument('path')
+    parser.add_argument('--dump',
+                        action='store_true',
+                        help='Print every line with its time in ms')
+    args = parser.parse_args()
+    records = ReadTrace(args.path)
+    if args.dump:
+        Dump(records)
+    else:
+        Report(records)
+
+
+if __name__ == "__main__":
+    main()